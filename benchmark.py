@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""Benchmark the MedicineReminder hot paths on synthetic datasets.
+
+Each dataset size runs in its own process, so RSS is measured per size; the
+dataset is generated and written by a further child process, so its memory
+does not count toward the results.
+Results are written as JSON; pass an earlier result as --baseline to compare
+throughput against it.
+
+    python benchmark.py --sizes 1000,10000,100000 --storage sqlite --output results.json
+    python benchmark.py --baseline results.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import datetime
+import tempfile
+import resource
+import subprocess
+import multiprocessing
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+# Importing main sets up logging; keep per-operation logs out of the timings
+logging.disable(logging.INFO)
+
+NAMES = ['Lisinopril', 'Metformin', 'Atorvastatin', 'Amlodipine', 'Omeprazole', 'Levothyroxine',
+         'Simvastatin', 'Losartan', 'Albuterol', 'Gabapentin', 'Sertraline', 'Metoprolol']
+DOSAGES = ['5mg', '10mg', '20mg', '25mg', '50mg', '100mg', '500mg']
+# Share of medicines with a reminder, and with a reminder that is due today
+REMINDER_RATIO = 0.8
+DUE_TODAY_RATIO = 0.01
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Return the nearest-rank percentile of sorted values"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def measure(operation: Callable[[int], None], ops: int) -> Dict:
+    """Time `ops` calls of operation(i) and report throughput and latency percentiles"""
+    latencies = []
+    started = time.perf_counter()
+    for i in range(ops):
+        op_started = time.perf_counter()
+        operation(i)
+        latencies.append(time.perf_counter() - op_started)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'ops': ops,
+        'seconds': round(elapsed, 6),
+        'ops_per_sec': round(ops / elapsed, 3) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 4),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 4),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 4),
+        'max_ms': round(latencies[-1] * 1000, 4) if latencies else 0.0,
+    }
+
+
+def medicine_key(i: int) -> str:
+    """Return the id of the i-th generated medicine"""
+    return f"med_{i:08x}"
+
+
+def current_rss() -> Optional[int]:
+    """Return the resident set size of this process in bytes, or None where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def generate_dataset(size: int, seed: int) -> Dict[str, Dict[str, Dict]]:
+    """Build `size` medicines with reminders and orders, identical for the same seed"""
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    medicines, reminders, orders = {}, {}, {}
+
+    for i in range(size):
+        medicine_id = medicine_key(i)
+        refill_period = rng.randint(7, 90)
+        days_before_empty = rng.randint(1, 7)
+        if rng.random() < DUE_TODAY_RATIO:
+            # Reminder date (last refill + period - days before empty) falls on today
+            last_refill = today - datetime.timedelta(days=refill_period - days_before_empty)
+        else:
+            last_refill = today - datetime.timedelta(days=rng.randint(0, 120))
+        added = last_refill - datetime.timedelta(days=rng.randint(0, 365))
+
+        medicines[medicine_id] = {
+            'id': medicine_id,
+            'patient_id': 'default',
+            'name': f"{rng.choice(NAMES)} {i}",
+            'dosage': rng.choice(DOSAGES),
+            'quantity': rng.choice([30, 60, 90]),
+            'refill_period_days': refill_period,
+            'added_date': added.isoformat(),
+            'last_refill_date': last_refill.isoformat(),
+        }
+        if rng.random() < REMINDER_RATIO:
+            reminders[medicine_id] = {
+                'medicine_id': medicine_id,
+                'patient_id': 'default',
+                'days_before_empty': days_before_empty,
+                # Due reminders fire at midnight, so they are already due when the benchmark scans
+                'reminder_time': '00:00' if last_refill + datetime.timedelta(
+                    days=refill_period - days_before_empty) == today else '08:00',
+            }
+        if i % 2 == 0:
+            order_id = f"order_{i:08x}"
+            orders[order_id] = {
+                'id': order_id,
+                'patient_id': 'default',
+                'medicine_id': medicine_id,
+                'medicine_name': medicines[medicine_id]['name'],
+                'medicine_dosage': medicines[medicine_id]['dosage'],
+                'order_date': last_refill.isoformat(),
+                'status': 'placed',
+            }
+
+    return {'medicines': medicines, 'reminders': reminders, 'orders': orders, 'notifications': {}}
+
+
+def write_dataset(storage, dataset: Dict[str, Dict[str, Dict]]):
+    """Store a generated dataset through a storage backend"""
+    changes = {}
+    for store, records in dataset.items():
+        data = storage.load(store)
+        for key, record in records.items():
+            data[key] = record
+        changes[store] = (data, None)
+    storage.save_all(changes)
+
+
+def create_dataset(data_dir: Path, size: int, seed: int, storage_mode: str, fsync: bool):
+    """Generate a dataset and store it in data_dir"""
+    from storage import create_storage
+
+    storage = create_storage(storage_mode, data_dir, fsync=fsync)
+    write_dataset(storage, generate_dataset(size, seed))
+    storage.close()
+
+
+def run_size(size: int, storage_mode: str, ops: int, seed: int, fsync: bool) -> Dict:
+    """Run every benchmark on one dataset size in this process"""
+    rng = random.Random(seed)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='medicine-reminder-bench-') as tmp:
+        data_dir = Path(tmp)
+        writer = multiprocessing.Process(target=create_dataset, args=(data_dir, size, seed, storage_mode, fsync))
+        writer.start()
+        writer.join()
+        if writer.exitcode != 0:
+            raise RuntimeError(f"Writing the {size} medicine dataset failed")
+
+        # Importing main builds the server's own registry; keep it away from the real data directory
+        os.environ['MEDICINE_REMINDER_DATA_DIR'] = str(data_dir / 'server')
+        os.environ['MEDICINE_REMINDER_STORAGE'] = storage_mode
+        from main import PatientRegistry, DEFAULT_PATIENT_ID
+        from metrics import METRICS
+
+        # Cold start: load every store and build the indexes and schedule
+        results['cold_start'] = measure(lambda i: PatientRegistry(data_dir, storage_mode, fsync).close(), 3)
+
+        patients = PatientRegistry(data_dir, storage_mode, fsync)
+        reminder = patients.shard(DEFAULT_PATIENT_ID)
+        rss_after_load = current_rss()
+
+        # A scan sending every reminder due today, then scans with nothing due
+        results['check_reminders_due'] = measure(lambda i: patients._check_reminders(), 1)
+        results['check_reminders_due']['reminders'] = METRICS.summary()['counters'].get('reminders_fired', 0)
+        results['check_reminders_idle'] = measure(lambda i: patients._check_reminders(), ops)
+
+        results['add_medicine'] = measure(
+            lambda i: reminder.add_medicine(f"Bench {i}", '10mg', 30, 30), ops
+        )
+        results['order_refill'] = measure(
+            lambda i: reminder.order_refill(medicine_key(rng.randrange(size))), ops
+        )
+        results['get_upcoming_reminders'] = measure(lambda i: reminder.get_upcoming_reminders(20), ops)
+        results['list_medicines'] = measure(lambda i: reminder.list_medicines(limit=50), ops)
+
+        # Full rewrite of the largest store
+        results['save_data'] = measure(
+            lambda i: reminder.storage.save('medicines', reminder.medicines), 3
+        )
+        patients.close()
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        peak_rss *= 1024
+    return {'size': size, 'rss_after_load_bytes': rss_after_load, 'peak_rss_bytes': peak_rss, 'benchmarks': results}
+
+
+def environment(storage_mode: str, ops: int, seed: int, fsync: bool) -> Dict:
+    """Describe what the results were measured on"""
+    from storage import YAML_IMPLEMENTATION
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'storage': storage_mode,
+        'fsync': fsync,
+        'yaml_implementation': YAML_IMPLEMENTATION,
+        'ops': ops,
+        'seed': seed,
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+def compare(results: Dict, baseline: Dict) -> List[str]:
+    """Describe the change in throughput of every benchmark also found in the baseline"""
+    baseline_runs = {run['size']: run for run in baseline['runs']}
+    lines = []
+    for run in results['runs']:
+        base = baseline_runs.get(run['size'])
+        if base is None:
+            continue
+        for name, result in run['benchmarks'].items():
+            base_result = base['benchmarks'].get(name)
+            if not base_result or not base_result['ops_per_sec']:
+                continue
+            change = (result['ops_per_sec'] / base_result['ops_per_sec'] - 1) * 100
+            lines.append(f"{run['size']:>9} {name:<24} {base_result['ops_per_sec']:>12.1f} -> "
+                         f"{result['ops_per_sec']:>12.1f} ops/s ({change:+.1f}%)")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MedicineReminder hot paths")
+    parser.add_argument('--sizes', default='1000,10000',
+                        help="comma-separated medicine counts, e.g. 1000,10000,100000,1000000")
+    parser.add_argument('--storage', default=os.environ.get('MEDICINE_REMINDER_STORAGE', 'yaml'),
+                        choices=['yaml', 'journal', 'sqlite'])
+    parser.add_argument('--fsync', action=argparse.BooleanOptionalAction,
+                        default=os.environ.get('MEDICINE_REMINDER_FSYNC', '1') == '1',
+                        help="fsync when writing the dataset and in the timed operations (default: on)")
+    parser.add_argument('--ops', type=int, default=200, help="operations per timed benchmark")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="write the JSON results to this file instead of stdout")
+    parser.add_argument('--baseline', help="earlier JSON results to compare throughput against")
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.size is not None:
+        # Child process: one dataset size
+        json.dump(run_size(args.size, args.storage, args.ops, args.seed, args.fsync), sys.stdout)
+        return
+
+    runs = []
+    for size in (int(size) for size in args.sizes.split(',')):
+        print(f"Benchmarking {size} medicines ({args.storage})", file=sys.stderr)
+        child = subprocess.run(
+            [sys.executable, __file__, '--size', str(size), '--storage', args.storage,
+             '--ops', str(args.ops), '--seed', str(args.seed), '--fsync' if args.fsync else '--no-fsync'],
+            stdout=subprocess.PIPE, text=True, check=True
+        )
+        runs.append(json.loads(child.stdout))
+
+    results = {'environment': environment(args.storage, args.ops, args.seed, args.fsync), 'runs': runs}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        print("\n".join(compare(results, baseline)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
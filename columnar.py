@@ -0,0 +1,77 @@
+import datetime
+import logging
+from typing import List, Mapping, Tuple
+
+from dateutil.parser import parse
+
+from records import Medicine, Reminder
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; the columnar engine is unavailable without it
+    np = None
+
+logger = logging.getLogger(__name__)
+
+
+def numpy_available() -> bool:
+    """Return whether the columnar engine can be used"""
+    return np is not None
+
+
+def _to_datetime64(value: str) -> 'np.datetime64':
+    """Convert a stored refill date to a day-resolution datetime64, or NaT if it cannot be parsed"""
+    try:
+        return np.datetime64(datetime.date.fromisoformat(value), 'D')
+    except (TypeError, ValueError):
+        pass
+    try:
+        # Legacy values that are not plain ISO dates
+        return np.datetime64(parse(value).date(), 'D')
+    except (TypeError, ValueError, OverflowError) as e:
+        logger.error(f"Skipping reminder with malformed last refill date {value!r}: {e}")
+        return np.datetime64('NaT', 'D')
+
+
+class DueDateColumns:
+    """Column store of reminder inputs aligned to medicine ids.
+
+    Each row holds a medicine's last refill date, refill period and the days
+    before empty of its reminder, so every reminder date is computed in one
+    vectorized pass. The columns are built once from the stored records;
+    later changes are indexed one medicine at a time.
+    """
+
+    def __init__(self, ids: List[str], last_refill: 'np.ndarray', refill_period: 'np.ndarray',
+                 days_before_empty: 'np.ndarray'):
+        self._ids = ids
+        self._last_refill = last_refill
+        self._refill_period = refill_period
+        self._days_before_empty = days_before_empty
+
+    @classmethod
+    def build(cls, medicines: Mapping[str, Medicine], reminders: Mapping[str, Reminder]) -> 'DueDateColumns':
+        """Build the columns from the current medicines and reminders"""
+        ids = [medicine_id for medicine_id in reminders if medicine_id in medicines]
+        refill_dates = [medicines[medicine_id].last_refill_date for medicine_id in ids]
+        try:
+            # numpy parses ISO dates itself, without a Python call per row
+            last_refill = np.array(refill_dates, dtype='datetime64[D]')
+        except (TypeError, ValueError):
+            last_refill = np.array([_to_datetime64(value) for value in refill_dates], dtype='datetime64[D]')
+        refill_period = np.fromiter((medicines[medicine_id].refill_period_days for medicine_id in ids),
+                                    dtype=np.int32, count=len(ids))
+        days_before_empty = np.fromiter((reminders[medicine_id].days_before_empty for medicine_id in ids),
+                                        dtype=np.int32, count=len(ids))
+        return cls(ids, last_refill, refill_period, days_before_empty)
+
+    def select(self, start: datetime.date) -> List[Tuple[str, datetime.date, datetime.date]]:
+        """Return (medicine_id, reminder_date, empty_date) for reminders due on or after start"""
+        empty_dates = self._last_refill + self._refill_period.astype('timedelta64[D]')
+        reminder_dates = empty_dates - self._days_before_empty.astype('timedelta64[D]')
+
+        # NaT compares false, so rows with unparseable dates are left out
+        rows = np.flatnonzero(reminder_dates >= np.datetime64(start, 'D')).tolist()
+        reminder_dates = reminder_dates.tolist()
+        empty_dates = empty_dates.tolist()
+        return [(self._ids[row], reminder_dates[row], empty_dates[row]) for row in rows]
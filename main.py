@@ -1,20 +1,40 @@
 #!/usr/bin/env python3
 
 import os
+import re
 import json
+import base64
 import uuid
-import yaml
 import logging
+import heapq
+import asyncio
+import functools
+import contextlib
+import atexit
+import bisect
+import time
 import datetime
-import schedule
 import threading
-import time
-from typing import Dict, List, Optional, Any
+import dataclasses
+try:
+    import fcntl
+except ImportError:  # not available on Windows, where only one server process is supported
+    fcntl = None
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Any
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from dateutil.parser import parse
-from dateutil.relativedelta import relativedelta
 
+import uvicorn
 from mcp.server.fastmcp import FastMCP
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse
+
+from storage import SQLITE_DATABASE, MemoryBackend, SQLiteDatabase, StorageBackend, WriteBehindFlusher, create_storage
+from columnar import DueDateColumns, numpy_available
+from metrics import METRICS
+from records import Medicine, Order, Reminder
+from notifications import DELIVERED, FAILED, PENDING, create_delivery, notification_id, retry_delay
 
 # Configure logging
 logging.basicConfig(
@@ -24,222 +44,1256 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Constants
-DATA_DIR = Path(os.path.dirname(os.path.abspath(__file__))) / "data"
-MEDICINES_FILE = DATA_DIR / "medicines.yaml"
-REMINDERS_FILE = DATA_DIR / "reminders.yaml"
-ORDERS_FILE = DATA_DIR / "orders.yaml"
+DATA_DIR = Path(os.environ.get(
+    "MEDICINE_REMINDER_DATA_DIR", Path(os.path.dirname(os.path.abspath(__file__))) / "data"
+))
+# Longest the scheduler sleeps before re-checking, so wall clock jumps
+# (suspend, NTP corrections) are noticed
+MAX_SCHEDULER_SLEEP = 3600
+# Stale schedule entries tolerated beyond twice the live ones before the heap is rebuilt
+SCHEDULE_COMPACT_SLACK = 64
+# Number of locks that per-medicine updates are striped across
+MEDICINE_LOCK_STRIPES = 64
+# Patient whose data lives directly in DATA_DIR; every other patient gets DATA_DIR/patients/<id>
+DEFAULT_PATIENT_ID = "default"
+PATIENT_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
 
-# Ensure data directory exists
-DATA_DIR.mkdir(exist_ok=True)
+# Storage mode: "yaml" rewrites the whole file on every save, "journal" appends
+# each mutation to a per-store log that is replayed on top of the YAML snapshot,
+# "sqlite" keeps records in an indexed SQLite database
+STORAGE_MODE = os.environ.get("MEDICINE_REMINDER_STORAGE", "yaml")
+# Number of journal records after which the log is folded back into the snapshot
+JOURNAL_COMPACT_THRESHOLD = int(os.environ.get("MEDICINE_REMINDER_JOURNAL_COMPACT", "10000"))
+# Keep msgpack snapshots next to the YAML files for fast startup (requires msgpack)
+BINARY_SNAPSHOT = os.environ.get("MEDICINE_REMINDER_SNAPSHOT", "0") == "1"
+# Seconds a change may wait in memory before a background thread writes it;
+# 0 writes synchronously in the request path
+WRITE_BEHIND_SECONDS = float(os.environ.get("MEDICINE_REMINDER_WRITE_BEHIND", "0"))
+if WRITE_BEHIND_SECONDS > 0 and STORAGE_MODE == "sqlite":
+    # Checked before the registry below opens any storage
+    raise SystemExit("MEDICINE_REMINDER_WRITE_BEHIND is not supported with sqlite storage, which commits every operation")
+# fsync data files and journals so saved changes survive a crash or power loss
+FSYNC = os.environ.get("MEDICINE_REMINDER_FSYNC", "1") == "1"
+# Worker threads that async tool calls offload blocking MedicineReminder work to
+EXECUTOR_WORKERS = int(os.environ.get("MEDICINE_REMINDER_WORKERS", "8"))
+# Compute reminder dates with the vectorized NumPy engine (requires numpy)
+COLUMNAR_ENGINE = os.environ.get("MEDICINE_REMINDER_COLUMNAR", "0") == "1"
+# Page size of list_medicines when the caller gives no limit, and the largest it may ask for
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# HTTP endpoint that reminder notifications are POSTed to; when unset they are only logged
+WEBHOOK_URL = os.environ.get("MEDICINE_REMINDER_WEBHOOK_URL")
+# Notifications delivered concurrently, each on its own delivery thread and pooled connection
+DELIVERY_WORKERS = int(os.environ.get("MEDICINE_REMINDER_DELIVERY_WORKERS", "4"))
+# Most queued notifications a delivery worker takes and records at once
+DELIVERY_BATCH_SIZE = int(os.environ.get("MEDICINE_REMINDER_DELIVERY_BATCH", "50"))
+# Messages per second the provider accepts (0 for no limit) and how many may be sent in a burst
+DELIVERY_RATE_LIMIT = float(os.environ.get("MEDICINE_REMINDER_RATE_LIMIT", "0"))
+DELIVERY_RATE_BURST = float(os.environ.get("MEDICINE_REMINDER_RATE_BURST", "0")) or None
+# Delivery attempts before a notification is marked failed
+DELIVERY_MAX_ATTEMPTS = int(os.environ.get("MEDICINE_REMINDER_DELIVERY_ATTEMPTS", "8"))
+# Days delivered and failed notifications are kept before the daily prune deletes them;
+# at least one, so a reminder is never queued twice on the same day
+NOTIFICATION_RETENTION_DAYS = max(1, int(os.environ.get("MEDICINE_REMINDER_NOTIFICATION_RETENTION_DAYS", "30")))
+# MCP transport: "stdio" serves one client over stdin/stdout, "streamable-http"
+# and "sse" serve many clients over the network
+TRANSPORT = os.environ.get("MEDICINE_REMINDER_TRANSPORT", "stdio")
+HTTP_HOST = os.environ.get("MEDICINE_REMINDER_HOST", "127.0.0.1")
+HTTP_PORT = int(os.environ.get("MEDICINE_REMINDER_PORT", "8000"))
+# Server processes for the streamable-http transport; more than one requires sqlite storage
+HTTP_WORKERS = int(os.environ.get("MEDICINE_REMINDER_HTTP_WORKERS", "1"))
+# Whether other server processes write to the same storage
+SHARED_STORAGE = HTTP_WORKERS > 1
+# Longest the scheduler sleeps when other processes may change reminders behind its back
+SHARED_SCHEDULER_POLL = 30
+# Seconds the scheduler and dispatcher wait before retrying work that failed unexpectedly
+SCHEDULER_RETRY_DELAY = 5
+# Port of the Prometheus /metrics endpoint in stdio mode (network transports serve it on their own port)
+METRICS_PORT = int(os.environ.get("MEDICINE_REMINDER_METRICS_PORT", "0"))
+# Bounds in seconds of the exponential backoff between delivery attempts
+DELIVERY_RETRY_BASE = 2
+DELIVERY_RETRY_MAX = 300
 
-# Initialize data files if they don't exist
-if not MEDICINES_FILE.exists():
-    with open(MEDICINES_FILE, 'w') as f:
-        yaml.dump({}, f)
 
-if not REMINDERS_FILE.exists():
-    with open(REMINDERS_FILE, 'w') as f:
-        yaml.dump({}, f)
+def parse_refill_date(value: str) -> datetime.date:
+    """Parse a stored refill date, falling back to dateutil for values that are not ISO dates"""
+    try:
+        return datetime.date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return parse(value).date()
 
-if not ORDERS_FILE.exists():
-    with open(ORDERS_FILE, 'w') as f:
-        yaml.dump({}, f)
 
+def parse_reminder_time(value: str) -> datetime.time:
+    """Parse an "HH:MM" reminder time, raising ValueError for anything else"""
+    match = re.fullmatch(r'(\d{1,2}):(\d{2})', value) if isinstance(value, str) else None
+    if match is None or int(match.group(1)) > 23 or int(match.group(2)) > 59:
+        raise ValueError(f"Invalid reminder time {value!r}, expected HH:MM")
+    return datetime.time(int(match.group(1)), int(match.group(2)))
 
-class MedicineReminder:
+
+class UpcomingIndex:
+    """Reminders ordered by reminder date, kept current as medicines and reminders change"""
+    
+    def __init__(self):
+        # Sorted (reminder_date, medicine_id, empty_date) entries
+        self._entries: List[Tuple[datetime.date, str, datetime.date]] = []
+        self._entry_of: Dict[str, Tuple[datetime.date, str, datetime.date]] = {}
+        self._lock = threading.Lock()
+    
+    def update(self, medicine_id: str, dates: Optional[Tuple[datetime.date, datetime.date]]):
+        """Replace a medicine's entry; `dates` is (empty_date, reminder_date) or None to drop it"""
+        with self._lock:
+            old = self._entry_of.pop(medicine_id, None)
+            if old is not None:
+                del self._entries[bisect.bisect_left(self._entries, old)]
+            if dates is not None:
+                empty_date, reminder_date = dates
+                entry = (reminder_date, medicine_id, empty_date)
+                bisect.insort(self._entries, entry)
+                self._entry_of[medicine_id] = entry
+    
+    def range(self, start: datetime.date, limit: Optional[int] = None) -> List[Tuple[datetime.date, str, datetime.date]]:
+        """Return entries with a reminder date on or after `start`, earliest first"""
+        with self._lock:
+            first = bisect.bisect_left(self._entries, (start,))
+            last = len(self._entries) if limit is None else first + limit
+            return self._entries[first:last]
+
+
+class MedicineNameIndex:
+    """Medicines ordered by case-folded name, so pages and name prefixes are found by bisection"""
+    
+    def __init__(self, medicines: Iterable[Medicine] = ()):
+        # Sorted (case-folded name, medicine_id) entries
+        self._entries: List[Tuple[str, str]] = sorted(
+            (medicine.name.casefold(), medicine.id) for medicine in medicines
+        )
+        self._entry_of: Dict[str, Tuple[str, str]] = {entry[1]: entry for entry in self._entries}
+        self._lock = threading.Lock()
+    
+    def update(self, medicine_id: str, name: Optional[str]):
+        """Replace a medicine's entry, or drop it when `name` is None"""
+        entry = None if name is None else (name.casefold(), medicine_id)
+        with self._lock:
+            old = self._entry_of.get(medicine_id)
+            if old == entry:
+                return
+            if old is not None:
+                del self._entries[bisect.bisect_left(self._entries, old)]
+                del self._entry_of[medicine_id]
+            if entry is not None:
+                bisect.insort(self._entries, entry)
+                self._entry_of[medicine_id] = entry
+    
+    def entry(self, medicine_id: str) -> Optional[Tuple[str, str]]:
+        """Return a medicine's (case-folded name, medicine_id) entry, or None if it is not indexed"""
+        return self._entry_of.get(medicine_id)
+    
+    def count(self, prefix: str = '') -> int:
+        """Return the number of medicines whose name starts with `prefix`"""
+        prefix = prefix.casefold()
+        with self._lock:
+            if not prefix:
+                return len(self._entries)
+            first = bisect.bisect_left(self._entries, (prefix,))
+            last = bisect.bisect_left(self._entries, (prefix[:-1] + chr(ord(prefix[-1]) + 1),))
+            return last - first
+    
+    def scan(self, prefix: str = '', after: Optional[Tuple[str, str]] = None) -> Iterator[Tuple[str, str]]:
+        """Yield entries whose name starts with `prefix`, in name order, starting past `after`"""
+        prefix = prefix.casefold()
+        if after is None or after < (prefix,):
+            after = (prefix,)
+        while True:
+            # Bisect for each step, as entries may be added while the caller pages
+            with self._lock:
+                position = bisect.bisect_right(self._entries, after)
+                if position == len(self._entries):
+                    return
+                entry = self._entries[position]
+            if not entry[0].startswith(prefix):
+                return
+            yield entry
+            after = entry
+
+
+class AddedDateIndex:
+    """Medicines ordered by added date, so the medicines added within a date range are found by bisection"""
+    
+    def __init__(self, medicines: Iterable[Medicine] = ()):
+        self._entry_of: Dict[str, Tuple[datetime.date, str]] = {}
+        for medicine in medicines:
+            entry = self._entry(medicine.id, medicine.added_date)
+            if entry is not None:
+                self._entry_of[medicine.id] = entry
+        # Sorted (added_date, medicine_id) entries
+        self._entries: List[Tuple[datetime.date, str]] = sorted(self._entry_of.values())
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _entry(medicine_id: str, added_date: Optional[str]) -> Optional[Tuple[datetime.date, str]]:
+        # Medicines without a readable added date match no date range
+        try:
+            return parse_refill_date(added_date), medicine_id
+        except (TypeError, ValueError, OverflowError):
+            return None
+    
+    def update(self, medicine_id: str, added_date: Optional[str]):
+        """Replace a medicine's entry, or drop it when `added_date` is None"""
+        entry = None if added_date is None else self._entry(medicine_id, added_date)
+        with self._lock:
+            old = self._entry_of.get(medicine_id)
+            if old == entry:
+                return
+            if old is not None:
+                del self._entries[bisect.bisect_left(self._entries, old)]
+                del self._entry_of[medicine_id]
+            if entry is not None:
+                bisect.insort(self._entries, entry)
+                self._entry_of[medicine_id] = entry
+    
+    def _bounds(self, start: Optional[datetime.date], end: Optional[datetime.date]) -> Tuple[int, int]:
+        first = 0 if start is None else bisect.bisect_left(self._entries, (start,))
+        # Medicine ids are ASCII, so they sort before this
+        last = len(self._entries) if end is None else bisect.bisect_right(self._entries, (end, '\uffff'))
+        return first, max(first, last)
+    
+    def count(self, start: Optional[datetime.date], end: Optional[datetime.date]) -> int:
+        """Return the number of medicines added within [start, end]"""
+        with self._lock:
+            first, last = self._bounds(start, end)
+            return last - first
+    
+    def ids(self, start: Optional[datetime.date], end: Optional[datetime.date]) -> List[str]:
+        """Return the ids of medicines added within [start, end]"""
+        with self._lock:
+            first, last = self._bounds(start, end)
+            return [medicine_id for _, medicine_id in self._entries[first:last]]
+    
+    def contains(self, medicine_id: str, start: Optional[datetime.date], end: Optional[datetime.date]) -> bool:
+        """Return whether a medicine was added within [start, end]"""
+        entry = self._entry_of.get(medicine_id)
+        return entry is not None and (start is None or entry[0] >= start) and (end is None or entry[0] <= end)
+
+
+def encode_cursor(entry: Tuple[str, str]) -> str:
+    """Turn the last index entry of a page into an opaque cursor"""
+    return base64.urlsafe_b64encode(json.dumps(entry).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Turn a cursor returned by list_medicines back into an index entry"""
+    try:
+        name_key, medicine_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(name_key, str) or not isinstance(medicine_id, str):
+        raise ValueError("Invalid cursor")
+    return name_key, medicine_id
+
+
+def page_limit(limit: Optional[int]) -> int:
+    """Return the number of results a listing call should return"""
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    return limit
+
+
+class ReminderSchedule:
+    """Min-heap of reminder fire times across every patient.
+    
+    Entries superseded by a later change stay in the heap and are skipped
+    when they no longer match the reminder's current fire time; the heap is
+    rebuilt from the live fire times once stale entries outnumber them.
+    """
+    
     def __init__(self):
-        self.medicines = self._load_data(MEDICINES_FILE)
-        self.reminders = self._load_data(REMINDERS_FILE)
-        self.orders = self._load_data(ORDERS_FILE)
+        # (fire time, patient_id, medicine_id)
+        self._heap: List[Tuple[datetime.datetime, str, str]] = []
+        self._next_fire: Dict[Tuple[str, str], datetime.datetime] = {}
+        self._lock = threading.Lock()
+        # Called, from whichever thread made the change, when the earliest fire time moves forward
+        self.on_change: Optional[Callable[[], None]] = None
+        # Processes that do not run the scheduler keep no fire times at all
+        self.enabled = True
+    
+    def disable(self):
+        """Drop every fire time and ignore later updates, in a process that never pops them"""
+        with self._lock:
+            self.enabled = False
+            self._heap = []
+            self._next_fire = {}
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._next_fire)
+    
+    def update(self, patient_id: str, medicine_id: str, fire_at: Optional[datetime.datetime]):
+        """Set a reminder's next fire time, or unschedule it with None"""
+        key = (patient_id, medicine_id)
+        moved_earlier = False
+        with self._lock:
+            if not self.enabled:
+                return
+            if fire_at is None:
+                self._next_fire.pop(key, None)
+            elif self._next_fire.get(key) != fire_at:
+                self._next_fire[key] = fire_at
+                heapq.heappush(self._heap, (fire_at, patient_id, medicine_id))
+            if len(self._heap) > 2 * len(self._next_fire) + SCHEDULE_COMPACT_SLACK:
+                self._heap = [(fire, patient, medicine) for (patient, medicine), fire in self._next_fire.items()]
+                heapq.heapify(self._heap)
+            moved_earlier = fire_at is not None and bool(self._heap) and self._heap[0] == (fire_at, patient_id, medicine_id)
+        
+        on_change = self.on_change
+        if moved_earlier and on_change is not None:
+            on_change()
+    
+    def pop_due(self, now: datetime.datetime) -> List[Tuple[datetime.datetime, str, str]]:
+        """Remove and return the scheduled reminders whose fire time has passed"""
+        due = []
+        examined = 0
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                fire_at, patient_id, medicine_id = heapq.heappop(self._heap)
+                examined += 1
+                if self._next_fire.get((patient_id, medicine_id)) != fire_at:
+                    continue  # Superseded by a later change
+                del self._next_fire[(patient_id, medicine_id)]
+                due.append((fire_at, patient_id, medicine_id))
+        METRICS.increment('scan_rows_examined', examined)
+        return due
+    
+    def seconds_until_next_fire(self) -> float:
+        """Return how long the scheduler may sleep before the next reminder is due"""
+        with self._lock:
+            if not self._heap:
+                return MAX_SCHEDULER_SLEEP
+            delay = (self._heap[0][0] - datetime.datetime.now()).total_seconds()
+        return min(delay, MAX_SCHEDULER_SLEEP)
+
+
+def patient_data_dir(patient_id: str, data_dir: Path = DATA_DIR) -> Path:
+    """Return the directory holding a patient's medicines, reminders and orders"""
+    if not PATIENT_ID_PATTERN.match(patient_id):
+        raise ValueError(f"Invalid patient ID {patient_id!r}")
+    if patient_id == DEFAULT_PATIENT_ID:
+        return data_dir
+    return data_dir / "patients" / patient_id
+
+
+class MedicineReminder:
+    def __init__(self, storage: Optional[StorageBackend] = None, patient_id: str = DEFAULT_PATIENT_ID,
+                 schedule: Optional[ReminderSchedule] = None, medicine_locks: Optional[List[threading.RLock]] = None):
+        self.patient_id = patient_id
+        self.storage = storage or create_storage(
+            STORAGE_MODE, patient_data_dir(patient_id), JOURNAL_COMPACT_THRESHOLD, BINARY_SNAPSHOT,
+            WRITE_BEHIND_SECONDS, FSYNC, SHARED_STORAGE, patient_id
+        )
+        self.schedule = schedule if schedule is not None else ReminderSchedule()
+        
+        self.medicines = self.storage.load('medicines')
+        self.reminders = self.storage.load('reminders')
+        self.orders = self.storage.load('orders')
+        # Outbox of reminder notifications, kept until delivered or failed for good
+        self.notifications = self.storage.load('notifications')
+        # Called with (patient_id, notification_id) once a queued notification is saved
+        self.on_notification: Optional[Callable[[str, str], None]] = None
         
-        # Start the scheduler in a separate thread
-        self.scheduler_thread = threading.Thread(target=self._run_scheduler)
-        self.scheduler_thread.daemon = True
-        self.scheduler_thread.start()
+        # Read-modify-write of a medicine's records happens under its stripe lock.
+        # Records are replaced rather than changed in place, so readers and
+        # serializers never observe a half-applied update.
+        # A registry passes one set of stripes shared by all of its patients.
+        self._medicine_locks = medicine_locks or [threading.RLock() for _ in range(MEDICINE_LOCK_STRIPES)]
         
-        logger.info("Medicine Reminder system initialized")
+        self._columnar = COLUMNAR_ENGINE and numpy_available()
+        if COLUMNAR_ENGINE and not self._columnar:
+            logger.warning("numpy is not installed; columnar engine disabled")
+        self._build_indexes()
+        
+        logger.info(f"Medicine Reminder system initialized for patient {patient_id}")
     
-    def _load_data(self, file_path: Path) -> Dict:
-        """Load data from YAML file"""
-        try:
-            with open(file_path, 'r') as f:
-                data = yaml.safe_load(f)
-                return data if data else {}
-        except Exception as e:
-            logger.error(f"Error loading data from {file_path}: {e}")
-            return {}
-    
-    def _save_data(self, data: Dict, file_path: Path) -> bool:
-        """Save data to YAML file"""
+    def _build_indexes(self):
+        """Build the in-memory indexes and schedule from the stored records"""
+        # Parsed last refill date of each medicine, filled on first use and
+        # updated by add_medicine and order_refill
+        self._refill_dates: Dict[str, datetime.date] = {}
+        
+        self._upcoming = UpcomingIndex()
+        self._by_name = MedicineNameIndex(self.medicines.values())
+        self._by_added = AddedDateIndex(self.medicines.values())
+        
+        # Reminders dated before today can neither fire nor be upcoming again
+        # until a change re-indexes them
+        today = datetime.datetime.now().date()
+        if self._columnar:
+            # Compute every reminder date in one vectorized pass; later changes
+            # are indexed one medicine at a time
+            columns = DueDateColumns.build(self.medicines, self.reminders)
+            indexed = [(medicine_id, (empty_date, reminder_date))
+                       for medicine_id, reminder_date, empty_date in columns.select(today)]
+        else:
+            indexed = [(medicine_id, None) for medicine_id in self.storage.reminder_ids(self.reminders, today)]
+        for medicine_id, dates in indexed:
+            try:
+                self._index_reminder(medicine_id, dates)
+            except (ValueError, TypeError) as e:
+                # One malformed stored reminder must not keep the server from starting
+                logger.error(f"Skipping malformed reminder of medicine {medicine_id} for patient {self.patient_id}: {e}")
+    
+    def sync(self):
+        """Apply the records that another process changed to the in-memory indexes"""
+        changes = self.storage.external_changes()
+        if changes is None:
+            logger.info(f"Reloading indexes of patient {self.patient_id} after changes by another process")
+            self._build_indexes()
+            return
+        
+        medicine_ids = changes.get('medicines', set()) | changes.get('reminders', set())
+        if not medicine_ids:
+            return
+        with self._locked(medicine_ids):
+            for medicine_id in medicine_ids:
+                self._refill_dates.pop(medicine_id, None)
+                try:
+                    self._refresh_indexes(medicine_id)
+                except (ValueError, TypeError) as e:
+                    logger.error(f"Skipping malformed reminder of medicine {medicine_id} for patient {self.patient_id}: {e}")
+    
+    def close(self):
+        """Write any pending changes and release the storage backend"""
+        self.storage.close()
+        logger.info("Medicine Reminder storage closed")
+    
+    @contextlib.contextmanager
+    def _locked(self, medicine_ids: Iterable[str]) -> Iterator[None]:
+        """Hold the stripe locks of the given medicines, acquired in a fixed order, within a storage transaction"""
+        stripes = sorted({hash(medicine_id) % MEDICINE_LOCK_STRIPES for medicine_id in medicine_ids})
+        for stripe in stripes:
+            self._medicine_locks[stripe].acquire()
         try:
-            with open(file_path, 'w') as f:
-                yaml.dump(data, f)
-            return True
-        except Exception as e:
-            logger.error(f"Error saving data to {file_path}: {e}")
-            return False
-    
-    def _run_scheduler(self):
-        """Run the scheduler in a loop"""
-        # Check for reminders every hour
-        schedule.every().hour.do(self._check_reminders)
+            with self.storage.transaction():
+                yield
+        finally:
+            for stripe in reversed(stripes):
+                self._medicine_locks[stripe].release()
+    
+    def _save(self, store: str, *keys: str) -> bool:
+        """Persist the changed records of a store"""
+        return self.storage.save(store, getattr(self, store), keys)
+    
+    def _save_stores(self, changes: Dict[str, List[str]]) -> bool:
+        """Persist the changed records of several stores together"""
+        return self.storage.save_all({store: (getattr(self, store), keys) for store, keys in changes.items()})
+    
+    def _last_refill_date(self, medicine: Medicine) -> datetime.date:
+        """Return a medicine's parsed last refill date"""
+        last_refill_date = self._refill_dates.get(medicine.id)
+        if last_refill_date is None:
+            last_refill_date = parse_refill_date(medicine.last_refill_date)
+            self._refill_dates[medicine.id] = last_refill_date
+        return last_refill_date
+    
+    def _reminder_dates(self, medicine: Medicine, reminder: Reminder) -> Tuple[datetime.date, datetime.date]:
+        """Return when a medicine will run out and when its reminder is due"""
+        last_refill_date = self._last_refill_date(medicine)
         
-        while True:
-            schedule.run_pending()
-            time.sleep(60)  # Sleep for 1 minute
+        # Calculate when medicine will run out
+        empty_date = last_refill_date + datetime.timedelta(days=medicine.refill_period_days)
+        reminder_date = empty_date - datetime.timedelta(days=reminder.days_before_empty)
+        return empty_date, reminder_date
     
-    def _check_reminders(self):
-        """Check for due reminders and send notifications"""
-        now = datetime.datetime.now()
-        today = now.date()
-        current_hour = now.hour
+    def _refresh_indexes(self, medicine_id: str):
+        """Bring every index up to date after a medicine or reminder changed"""
+        medicine = self.medicines.get(medicine_id)
+        self._by_name.update(medicine_id, None if medicine is None else medicine.name)
+        self._by_added.update(medicine_id, None if medicine is None else medicine.added_date)
+        self._index_reminder(medicine_id)
+    
+    def _index_reminder(self, medicine_id: str, dates: Optional[Tuple[datetime.date, datetime.date]] = None):
+        """Put a medicine's reminder dates into the upcoming index and scheduler, computing them
+        unless they are given"""
+        medicine = self.medicines.get(medicine_id)
+        reminder = self.reminders.get(medicine_id)
+        if medicine is None or reminder is None:
+            dates = None
+        elif dates is None:
+            dates = self._reminder_dates(medicine, reminder)
         
-        for medicine_id, reminder in self.reminders.items():
-            if medicine_id not in self.medicines:
-                continue
-                
-            medicine = self.medicines[medicine_id]
-            last_refill_date = parse(medicine.get('last_refill_date', medicine.get('added_date')))
-            quantity = medicine.get('quantity', 30)
-            refill_period = medicine.get('refill_period_days', 30)
-            days_before_empty = reminder.get('days_before_empty', 5)
-            reminder_time = reminder.get('reminder_time', '08:00')
-            reminder_hour = int(reminder_time.split(':')[0])
-            
-            # Calculate when medicine will run out
-            empty_date = last_refill_date + relativedelta(days=refill_period)
-            reminder_date = empty_date - relativedelta(days=days_before_empty)
-            
-            # Check if reminder is due today at this hour
-            if (reminder_date.date() == today and 
-                reminder_hour == current_hour and 
-                not reminder.get('last_reminded_date') == today.isoformat()):
+        self._upcoming.update(medicine_id, dates)
+        self._schedule_reminder(medicine_id, reminder, dates)
+    
+    def _schedule_reminder(self, medicine_id: str, reminder: Optional[Reminder],
+                           dates: Optional[Tuple[datetime.date, datetime.date]]):
+        """Recompute the next fire time of a medicine's reminder after its inputs changed"""
+        fire_at = None
+        if dates is not None:
+            _, reminder_date = dates
+            if reminder.last_reminded_date != reminder_date.isoformat():
+                fire_at = datetime.datetime.combine(reminder_date, parse_reminder_time(reminder.reminder_time))
+        
+        self.schedule.update(self.patient_id, medicine_id, fire_at)
+    
+    def _new_notification(self, medicine_id: str, reminder_date: datetime.date) -> Optional[Dict]:
+        """Create the pending notification of a due reminder, or return None if it was already queued"""
+        key = notification_id(medicine_id, reminder_date.isoformat())
+        if key in self.notifications:
+            return None
+        
+        medicine = self.medicines[medicine_id]
+        now = datetime.datetime.now().isoformat(timespec='seconds')
+        notification = {
+            'id': key,
+            'patient_id': self.patient_id,
+            'medicine_id': medicine_id,
+            'message': f"Reminder: Your {medicine.name} ({medicine.dosage}) will run out soon. Reply 'ORDER {medicine_id}' to place a refill order.",
+            'status': PENDING,
+            'attempts': 0,
+            'created_at': now,
+            'next_attempt_at': now,
+        }
+        
+        self.notifications[key] = notification
+        return notification
+    
+    def _queue_due_reminders(self, medicine_ids: List[str], today: datetime.date):
+        """Queue notifications for reminders popped from the schedule as due today"""
+        queued = []
+        reminded = []
+        with self._locked(medicine_ids):
+            for medicine_id in medicine_ids:
+                if medicine_id not in self.medicines or medicine_id not in self.reminders:
+                    continue
                 
-                # Send WhatsApp reminder (simulated for now)
-                self._send_whatsapp_reminder(medicine_id)
+                notification = self._new_notification(medicine_id, today)
                 
                 # Update last reminded date
-                self.reminders[medicine_id]['last_reminded_date'] = today.isoformat()
-                self._save_data(self.reminders, REMINDERS_FILE)
+                reminder = dataclasses.replace(self.reminders[medicine_id], last_reminded_date=today.isoformat())
+                self.reminders[medicine_id] = reminder
+                reminded.append(medicine_id)
+                if notification is not None:
+                    queued.append(notification['id'])
+                    logger.info(f"Queued WhatsApp reminder for {self.medicines[medicine_id].name}")
+            
+            # Every notification and the reminders they answer are saved together, once per scan
+            if reminded:
+                self._save_stores({'reminders': reminded, 'notifications': queued})
+        
+        METRICS.increment('reminders_fired', len(queued))
+        on_notification = self.on_notification
+        if on_notification is not None:
+            for key in queued:
+                on_notification(self.patient_id, key)
     
-    def _send_whatsapp_reminder(self, medicine_id: str):
-        """Send a WhatsApp reminder for medicine refill (simulated)"""
-        medicine = self.medicines[medicine_id]
-        logger.info(f"Sending WhatsApp reminder for {medicine['name']} ({medicine['dosage']})")
+    def _record_deliveries(self, results: Dict[str, Optional[str]]) -> Dict[str, float]:
+        """Record the outcome of delivery attempts, given as notification_id -> error or None.
+        
+        Returns the delay in seconds before the next attempt of each notification
+        to retry; delivered ones and ones out of attempts are left out.
+        """
+        notifications = {key: self.notifications.get(key) for key in results}
+        notifications = {key: notification for key, notification in notifications.items() if notification is not None}
         
-        # In a real implementation, this would use a WhatsApp API
-        # For now, we just log the reminder
-        message = f"Reminder: Your {medicine['name']} ({medicine['dosage']}) will run out soon. Reply 'ORDER {medicine_id}' to place a refill order."
-        logger.info(f"WhatsApp message: {message}")
+        retries = {}
+        with self._locked([notification['medicine_id'] for notification in notifications.values()]):
+            now = datetime.datetime.now()
+            for key in notifications:
+                notification = self.notifications[key]
+                error = results[key]
+                attempts = notification.get('attempts', 0) + 1
+                if error is None:
+                    changes = {'status': DELIVERED, 'delivered_at': now.isoformat(timespec='seconds')}
+                elif attempts >= DELIVERY_MAX_ATTEMPTS:
+                    changes = {'status': FAILED, 'failed_at': now.isoformat(timespec='seconds')}
+                    logger.error(f"Giving up on notification {key} after {attempts} attempts: {error}")
+                else:
+                    delay = retry_delay(attempts, DELIVERY_RETRY_BASE, DELIVERY_RETRY_MAX)
+                    changes = {'next_attempt_at': (now + datetime.timedelta(seconds=delay)).isoformat(timespec='seconds')}
+                    retries[key] = delay
+                    logger.warning(f"Delivery of notification {key} failed (attempt {attempts}), retrying in {delay:.1f}s: {error}")
+                
+                self.notifications[key] = dict(notification, attempts=attempts, last_error=error, **changes)
+            self._save('notifications', *notifications)
+        return retries
     
-    def add_medicine(self, name: str, dosage: str, quantity: int, refill_period_days: int) -> Dict:
-        """Add a new medicine to track"""
+    def prune_notifications(self, before: datetime.datetime) -> int:
+        """Delete delivered and failed notifications that finished before `before`; returns how many"""
+        cutoff = before.isoformat(timespec='seconds')
+        expired = []
+        for status in (DELIVERED, FAILED):
+            for key in self.storage.notification_ids(self.notifications, status):
+                notification = self.notifications.get(key)
+                if notification is None:
+                    continue
+                finished_at = notification.get('delivered_at') or notification.get('failed_at') or notification['created_at']
+                if finished_at < cutoff:
+                    expired.append((notification['medicine_id'], key))
+        if not expired:
+            return 0
+        
+        with self._locked([medicine_id for medicine_id, _ in expired]):
+            for _, key in expired:
+                self.notifications.pop(key, None)
+            self._save('notifications', *[key for _, key in expired])
+        logger.info(f"Pruned {len(expired)} finished notifications of patient {self.patient_id}")
+        return len(expired)
+    
+    def pending_notifications(self) -> List[Tuple[str, float]]:
+        """Return (notification_id, seconds until its next attempt) for every undelivered notification"""
+        now = datetime.datetime.now()
+        pending = []
+        for key in self.storage.notification_ids(self.notifications, PENDING):
+            next_attempt_at = datetime.datetime.fromisoformat(self.notifications[key]['next_attempt_at'])
+            pending.append((key, max(0.0, (next_attempt_at - now).total_seconds())))
+        return pending
+    
+    def _new_medicine(self, name: str, dosage: str, quantity: int, refill_period_days: int) -> Medicine:
+        """Create a medicine record and place it in memory without persisting it"""
         medicine_id = f"med_{uuid.uuid4().hex[:8]}"
-        today = datetime.datetime.now().date().isoformat()
-        
-        medicine = {
-            'id': medicine_id,
-            'name': name,
-            'dosage': dosage,
-            'quantity': quantity,
-            'refill_period_days': refill_period_days,
-            'added_date': today,
-            'last_refill_date': today
-        }
+        refill_date = datetime.datetime.now().date()
+        today = refill_date.isoformat()
+        
+        medicine = Medicine(
+            id=medicine_id,
+            patient_id=self.patient_id,
+            name=name,
+            dosage=dosage,
+            quantity=quantity,
+            refill_period_days=refill_period_days,
+            added_date=today,
+            last_refill_date=today
+        )
         
         self.medicines[medicine_id] = medicine
-        self._save_data(self.medicines, MEDICINES_FILE)
+        self._refill_dates[medicine_id] = refill_date
+        return medicine
+    
+    def add_medicine(self, name: str, dosage: str, quantity: int, refill_period_days: int) -> Medicine:
+        """Add a new medicine to track"""
+        with self.storage.transaction():
+            medicine = self._new_medicine(name, dosage, quantity, refill_period_days)
+            medicine_id = medicine.id
+            self._save('medicines', medicine_id)
+        self._refresh_indexes(medicine_id)
         
         return medicine
     
-    def list_medicines(self) -> List[Dict]:
-        """List all tracked medicines"""
-        return list(self.medicines.values())
+    @staticmethod
+    def validate_medicines(medicines: List[Dict]):
+        """Raise ValueError unless every item describes a medicine to add"""
+        for index, item in enumerate(medicines):
+            for field, field_type in (('name', str), ('dosage', str), ('quantity', int), ('refill_period_days', int)):
+                if not isinstance(item.get(field), field_type):
+                    raise ValueError(f"Medicine {index}: '{field}' must be a {field_type.__name__}")
     
-    def set_reminder(self, medicine_id: str, days_before_empty: int, reminder_time: str) -> Dict:
-        """Set or update a reminder for a specific medicine"""
-        if medicine_id not in self.medicines:
-            raise ValueError(f"Medicine with ID {medicine_id} not found")
+    def add_medicines(self, medicines: List[Dict]) -> List[Medicine]:
+        """Add several medicines to track, persisting them in a single write"""
+        # Validate every item before changing anything
+        self.validate_medicines(medicines)
         
-        reminder = {
-            'medicine_id': medicine_id,
-            'days_before_empty': days_before_empty,
-            'reminder_time': reminder_time,
-        }
+        with self.storage.transaction():
+            added = [
+                self._new_medicine(item['name'], item['dosage'], item['quantity'], item['refill_period_days'])
+                for item in medicines
+            ]
+            self._save('medicines', *[medicine.id for medicine in added])
+        for medicine in added:
+            self._refresh_indexes(medicine.id)
         
-        self.reminders[medicine_id] = reminder
-        self._save_data(self.reminders, REMINDERS_FILE)
+        return added
+    
+    def list_medicines(self, limit: Optional[int] = None, cursor: Optional[str] = None,
+                       name_prefix: str = '', added_from: Optional[str] = None,
+                       added_to: Optional[str] = None) -> Dict:
+        """List one page of tracked medicines in name order.
+        
+        Returns {'medicines': [...], 'next_cursor': ...}; pass next_cursor back to
+        get the following page, it is None on the last page.
+        
+        A page walks whichever of the name and added-date indexes selects fewer
+        medicines; with both filters set, that costs up to the smaller of the
+        two counts rather than the page size.
+        """
+        limit = page_limit(limit)
+        after = decode_cursor(cursor) if cursor else None
+        added_from = parse_refill_date(added_from) if added_from else None
+        added_to = parse_refill_date(added_to) if added_to else None
+        dated = added_from is not None or added_to is not None
         
+        if dated and self._by_added.count(added_from, added_to) < self._by_name.count(name_prefix):
+            prefix = name_prefix.casefold()
+            entries = sorted(
+                entry for entry in map(self._by_name.entry, self._by_added.ids(added_from, added_to))
+                if entry is not None and entry[0].startswith(prefix) and (after is None or entry > after)
+            )
+        else:
+            entries = self._by_name.scan(name_prefix, after)
+        
+        page = []
+        last_entry = None
+        for entry in entries:
+            if len(page) == limit:
+                return {'medicines': page, 'next_cursor': encode_cursor(last_entry)}
+            medicine = self.medicines.get(entry[1])
+            if medicine is None:
+                continue
+            if dated and not self._by_added.contains(entry[1], added_from, added_to):
+                continue
+            page.append(medicine)
+            last_entry = entry
+        
+        return {'medicines': page, 'next_cursor': None}
+    
+    def _new_reminder(self, medicine_id: str, days_before_empty: int, reminder_time: str) -> Reminder:
+        """Create or replace a reminder record in memory without persisting it"""
+        reminder = Reminder(
+            medicine_id=medicine_id,
+            patient_id=self.patient_id,
+            days_before_empty=days_before_empty,
+            reminder_time=reminder_time,
+        )
+        
+        self.reminders[medicine_id] = reminder
         return reminder
     
-    def order_refill(self, medicine_id: str) -> Dict:
-        """Place a refill order for a specific medicine"""
+    def set_reminder(self, medicine_id: str, days_before_empty: int, reminder_time: str) -> Reminder:
+        """Set or update a reminder for a specific medicine"""
         if medicine_id not in self.medicines:
             raise ValueError(f"Medicine with ID {medicine_id} not found")
+        parse_reminder_time(reminder_time)
+        
+        with self._locked([medicine_id]):
+            reminder = self._new_reminder(medicine_id, days_before_empty, reminder_time)
+            self._save('reminders', medicine_id)
+            self._refresh_indexes(medicine_id)
+        
+        return reminder
+    
+    def set_reminders(self, reminders: List[Dict]) -> List[Reminder]:
+        """Set or update reminders for several medicines, persisting them in a single write"""
+        # Validate every item before changing anything
+        for index, item in enumerate(reminders):
+            for field, field_type in (('medicine_id', str), ('days_before_empty', int), ('reminder_time', str)):
+                if not isinstance(item.get(field), field_type):
+                    raise ValueError(f"Reminder {index}: '{field}' must be a {field_type.__name__}")
+            try:
+                parse_reminder_time(item['reminder_time'])
+            except ValueError as e:
+                raise ValueError(f"Reminder {index}: {e}")
+            if item['medicine_id'] not in self.medicines:
+                raise ValueError(f"Medicine with ID {item['medicine_id']} not found")
+        
+        medicine_ids = [item['medicine_id'] for item in reminders]
+        with self._locked(medicine_ids):
+            updated = [
+                self._new_reminder(item['medicine_id'], item['days_before_empty'], item['reminder_time'])
+                for item in reminders
+            ]
+            self._save('reminders', *medicine_ids)
+            for medicine_id in medicine_ids:
+                self._refresh_indexes(medicine_id)
         
+        return updated
+    
+    def _new_order(self, medicine_id: str) -> Order:
+        """Create an order and record the refill in memory without persisting either"""
         medicine = self.medicines[medicine_id]
-        today = datetime.datetime.now().date().isoformat()
+        refill_date = datetime.datetime.now().date()
+        today = refill_date.isoformat()
         
-        order = {
-            'id': f"order_{uuid.uuid4().hex[:8]}",
-            'medicine_id': medicine_id,
-            'medicine_name': medicine['name'],
-            'medicine_dosage': medicine['dosage'],
-            'order_date': today,
-            'status': 'placed'
-        }
+        order = Order(
+            id=f"order_{uuid.uuid4().hex[:8]}",
+            patient_id=self.patient_id,
+            medicine_id=medicine_id,
+            medicine_name=medicine.name,
+            medicine_dosage=medicine.dosage,
+            order_date=today,
+            status='placed'
+        )
         
         # Update medicine's last refill date
-        self.medicines[medicine_id]['last_refill_date'] = today
-        self._save_data(self.medicines, MEDICINES_FILE)
+        self.medicines[medicine_id] = dataclasses.replace(medicine, last_refill_date=today)
+        self._refill_dates[medicine_id] = refill_date
+        
+        self.orders[order.id] = order
+        return order
+    
+    def order_refill(self, medicine_id: str) -> Order:
+        """Place a refill order for a specific medicine"""
+        if medicine_id not in self.medicines:
+            raise ValueError(f"Medicine with ID {medicine_id} not found")
         
-        # Save the order
-        order_id = order['id']
-        self.orders[order_id] = order
-        self._save_data(self.orders, ORDERS_FILE)
+        with self._locked([medicine_id]):
+            order = self._new_order(medicine_id)
+            self._save_stores({'medicines': [medicine_id], 'orders': [order.id]})
+            self._refresh_indexes(medicine_id)
         
         return order
     
-    def get_upcoming_reminders(self) -> List[Dict]:
-        """Get a list of upcoming medication reminders"""
+    def order_refills(self, medicine_ids: List[str]) -> List[Order]:
+        """Place refill orders for several medicines, persisting each store once"""
+        for medicine_id in medicine_ids:
+            if medicine_id not in self.medicines:
+                raise ValueError(f"Medicine with ID {medicine_id} not found")
+        
+        with self._locked(medicine_ids):
+            orders = [self._new_order(medicine_id) for medicine_id in medicine_ids]
+            self._save_stores({'medicines': medicine_ids, 'orders': [order.id for order in orders]})
+            for medicine_id in medicine_ids:
+                self._refresh_indexes(medicine_id)
+        
+        return orders
+    
+    def get_status(self) -> Dict:
+        """Report the active storage and engine configuration with record counts"""
+        return {
+            'storage': self.storage.status(),
+            'columnar_engine': self._columnar,
+            'medicines': len(self.medicines),
+            'reminders': len(self.reminders),
+            'orders': len(self.orders),
+            'notifications': {
+                status: len(self.storage.notification_ids(self.notifications, status))
+                for status in (PENDING, DELIVERED, FAILED)
+            },
+        }
+    
+    def get_upcoming_reminders(self, limit: Optional[int] = None) -> List[Dict]:
+        """Get a list of upcoming medication reminders, optionally only the first `limit`"""
+        if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+        today = datetime.datetime.now().date()
+        
         upcoming = []
+        for reminder_date, medicine_id, empty_date in self._upcoming.range(today, limit):
+            medicine = self.medicines[medicine_id]
+            upcoming.append({
+                'medicine_id': medicine_id,
+                'medicine_name': medicine.name,
+                'medicine_dosage': medicine.dosage,
+                'reminder_date': reminder_date.isoformat(),
+                'empty_date': empty_date.isoformat(),
+                'reminder_time': self.reminders[medicine_id].reminder_time
+            })
+        return upcoming
+
+
+class PatientRegistry:
+    """Per-patient MedicineReminder shards that share one reminder schedule.
+    
+    Each patient's records are stored and indexed separately, so a request
+    only touches the shard of the patient it names. The shards share what
+    would otherwise grow with the number of patients: one SQLite connection,
+    one write-behind flusher thread and one set of medicine lock stripes.
+    """
+    
+    def __init__(self, data_dir: Path = DATA_DIR, storage_mode: str = STORAGE_MODE, fsync: bool = FSYNC):
+        self.data_dir = data_dir
+        self.storage_mode = storage_mode
+        self.fsync = fsync
+        self.schedule = ReminderSchedule()
+        self._database = (
+            SQLiteDatabase(data_dir / SQLITE_DATABASE, change_log=SHARED_STORAGE) if storage_mode == 'sqlite' else None
+        )
+        self._flusher = WriteBehindFlusher(WRITE_BEHIND_SECONDS) if WRITE_BEHIND_SECONDS > 0 else None
+        self._medicine_locks = [threading.RLock() for _ in range(MEDICINE_LOCK_STRIPES)]
+        # Called with (patient_id, notification_id) whenever a shard queues a notification
+        self.on_notification: Optional[Callable[[str, str], None]] = None
+        self._shards: Dict[str, MedicineReminder] = {}
+        self._lock = threading.Lock()
+        # Day on which finished notifications were last pruned
+        self._pruned_on: Optional[datetime.date] = None
+        
+        # Load every stored patient so all of their reminders are scheduled
+        self.shard(DEFAULT_PATIENT_ID)
+        self.discover()
+    
+    def discover(self):
+        """Load the stored patients that have no shard yet"""
+        if self._database is not None:
+            for patient_id in self._database.patient_ids():
+                if patient_id not in self._shards and PATIENT_ID_PATTERN.match(patient_id):
+                    self.shard(patient_id)
+            return
+        patients_dir = self.data_dir / "patients"
+        if patients_dir.is_dir():
+            for patient_dir in sorted(patients_dir.iterdir()):
+                if patient_dir.is_dir() and PATIENT_ID_PATTERN.match(patient_dir.name):
+                    self.shard(patient_dir.name)
+    
+    def _stored(self, patient_id: str) -> bool:
+        """Return whether a patient has stored records, possibly written by another process"""
+        if self._database is not None:
+            return self._database.has_patient(patient_id)
+        return patient_data_dir(patient_id, self.data_dir).is_dir()
+    
+    def sync(self):
+        """Pick up patients and changes that other server processes stored"""
+        self.discover()
+        for shard in list(self._shards.values()):
+            shard.sync()
+    
+    def shard(self, patient_id: str, create: bool = True) -> Optional[MedicineReminder]:
+        """Return a patient's MedicineReminder, loading it on first use.
+        
+        A patient with no stored data is created only if `create` is set;
+        otherwise None is returned and nothing is written to disk.
+        """
+        shard = self._shards.get(patient_id)
+        if shard is not None:
+            return shard
+        
+        data_dir = patient_data_dir(patient_id, self.data_dir)
+        with self._lock:
+            shard = self._shards.get(patient_id)
+            if shard is None:
+                # Another process may have created the patient since discover()
+                if not create and patient_id != DEFAULT_PATIENT_ID and not self._stored(patient_id):
+                    return None
+                storage = create_storage(
+                    self.storage_mode, data_dir, JOURNAL_COMPACT_THRESHOLD, BINARY_SNAPSHOT,
+                    WRITE_BEHIND_SECONDS, self.fsync, SHARED_STORAGE, patient_id, self._database, self._flusher
+                )
+                shard = MedicineReminder(storage, patient_id, self.schedule, self._medicine_locks)
+                shard.on_notification = self._notification_queued
+                self._shards[patient_id] = shard
+        return shard
+    
+    def _check_reminders(self):
+        """Check for due reminders and send notifications"""
+        started = time.perf_counter()
         now = datetime.datetime.now()
         today = now.date()
         
-        for medicine_id, reminder in self.reminders.items():
-            if medicine_id not in self.medicines:
+        due_by_patient: Dict[str, List[Tuple[datetime.datetime, str]]] = {}
+        for fire_at, patient_id, medicine_id in self.schedule.pop_due(now):
+            # Reminders missed on an earlier day are dropped, not sent late
+            if fire_at.date() == today:
+                due_by_patient.setdefault(patient_id, []).append((fire_at, medicine_id))
+        
+        failed = []
+        for patient_id, due in due_by_patient.items():
+            try:
+                self.shard(patient_id)._queue_due_reminders([medicine_id for _, medicine_id in due], today)
+            except Exception as e:
+                logger.error(f"Error queueing due reminders of patient {patient_id}: {e}")
+                failed.append(patient_id)
+                # Put them back on the schedule so the next scan retries them
+                for fire_at, medicine_id in due:
+                    self.schedule.update(patient_id, medicine_id, fire_at)
+        METRICS.scan_latency.observe(time.perf_counter() - started)
+        
+        if self._pruned_on != today:
+            self._pruned_on = today
+            cutoff = now - datetime.timedelta(days=NOTIFICATION_RETENTION_DAYS)
+            for shard in list(self._shards.values()):
+                try:
+                    shard.prune_notifications(cutoff)
+                except Exception as e:
+                    logger.error(f"Error pruning notifications of patient {shard.patient_id}: {e}")
+        
+        if failed:
+            raise RuntimeError(f"Due reminders of {len(failed)} patients could not be queued")
+    
+    def _notification_queued(self, patient_id: str, key: str):
+        on_notification = self.on_notification
+        if on_notification is not None:
+            on_notification(patient_id, key)
+    
+    def pending_batch(self, keys: List[Tuple[str, str]]) -> List[Dict]:
+        """Return the records of the given (patient_id, notification_id) that are still pending"""
+        batch = []
+        for patient_id, key in keys:
+            notification = self.shard(patient_id).notifications.get(key)
+            if notification is not None and notification['status'] == PENDING:
+                batch.append(notification)
+        return batch
+    
+    def record_deliveries(self, notifications: List[Dict], errors: List[Optional[str]]) -> List[Tuple[str, str, float]]:
+        """Record delivery outcomes, one write per patient; returns (patient_id, notification_id, delay) to retry"""
+        results_by_patient: Dict[str, Dict[str, Optional[str]]] = {}
+        for notification, error in zip(notifications, errors):
+            results_by_patient.setdefault(notification['patient_id'], {})[notification['id']] = error
+        
+        return [
+            (patient_id, key, delay)
+            for patient_id, results in results_by_patient.items()
+            for key, delay in self.shard(patient_id)._record_deliveries(results).items()
+        ]
+    
+    def pending_notifications(self) -> List[Tuple[str, str, float]]:
+        """Return (patient_id, notification_id, seconds until its next attempt) across all patients"""
+        return [
+            (shard.patient_id, key, delay)
+            for shard in list(self._shards.values())
+            for key, delay in shard.pending_notifications()
+        ]
+    
+    def get_status(self) -> Dict:
+        """Report the storage configuration with record counts summed over all patients"""
+        shards = list(self._shards.values())
+        statuses = [shard.get_status() for shard in shards]
+        return {
+            'storage': self._shards[DEFAULT_PATIENT_ID].storage.status(),
+            'columnar_engine': statuses[0]['columnar_engine'],
+            'patients': len(shards),
+            'medicines': sum(status['medicines'] for status in statuses),
+            'reminders': sum(status['reminders'] for status in statuses),
+            'orders': sum(status['orders'] for status in statuses),
+            'notifications': {
+                state: sum(status['notifications'][state] for status in statuses)
+                for state in (PENDING, DELIVERED, FAILED)
+            },
+            'scheduled_reminders': len(self.schedule),
+        }
+    
+    def close(self):
+        """Write any pending changes of every patient and release their storage"""
+        with self._lock:
+            for shard in self._shards.values():
+                shard.close()
+            if self._flusher is not None:
+                self._flusher.close()
+            if self._database is not None:
+                self._database.close()
+
+
+class NotificationDispatcher:
+    """Delivers queued notifications in batches with a pool of async workers.
+    
+    Deliveries run on their own threads, so a slow provider holds up neither
+    tool calls nor the reminder scan. Each worker takes up to
+    DELIVERY_BATCH_SIZE queued notifications, sends them over the client's
+    pooled connections and records the outcomes with one write per patient.
+    Failed deliveries are retried with exponential backoff until
+    DELIVERY_MAX_ATTEMPTS.
+    """
+    
+    def __init__(self, patients: PatientRegistry, client, workers: int = DELIVERY_WORKERS,
+                 batch_size: int = DELIVERY_BATCH_SIZE):
+        self.patients = patients
+        # LogDelivery or WhatsAppClient
+        self.client = client
+        self.workers = workers
+        self.batch_size = batch_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="notification-delivery")
+        # (patient_id, notification_id) being delivered, so a notification queued twice is sent once
+        self._in_flight = set()
+    
+    async def _run(self, method, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(method, *args))
+    
+    async def run(self):
+        """Deliver notifications as they are queued; runs until cancelled"""
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        
+        def enqueue(patient_id: str, key: str, delay: float = 0):
+            if delay > 0:
+                loop.call_later(delay, queue.put_nowait, (patient_id, key))
+            else:
+                queue.put_nowait((patient_id, key))
+        
+        self.patients.on_notification = lambda patient_id, key: loop.call_soon_threadsafe(enqueue, patient_id, key)
+        try:
+            # Resume notifications left pending when the server last stopped
+            while True:
+                try:
+                    pending = await self._run(self.patients.pending_notifications)
+                    break
+                except Exception as e:
+                    logger.error(f"Error loading pending notifications, retrying in {SCHEDULER_RETRY_DELAY}s: {e}")
+                    await asyncio.sleep(SCHEDULER_RETRY_DELAY)
+            for patient_id, key, delay in pending:
+                enqueue(patient_id, key, delay)
+            await asyncio.gather(*(self._work(queue, enqueue) for _ in range(self.workers)))
+        finally:
+            self.patients.on_notification = None
+    
+    async def _work(self, queue: asyncio.Queue, enqueue: Callable[[str, str, float], None]):
+        while True:
+            keys = [await queue.get()]
+            while len(keys) < self.batch_size and not queue.empty():
+                keys.append(queue.get_nowait())
+            keys = [item for item in dict.fromkeys(keys) if item not in self._in_flight]
+            if not keys:
                 continue
-                
-            medicine = self.medicines[medicine_id]
-            last_refill_date = parse(medicine.get('last_refill_date', medicine.get('added_date')))
-            refill_period = medicine.get('refill_period_days', 30)
-            days_before_empty = reminder.get('days_before_empty', 5)
-            
-            # Calculate when medicine will run out
-            empty_date = last_refill_date + relativedelta(days=refill_period)
-            reminder_date = empty_date - relativedelta(days=days_before_empty)
             
-            # Only include future reminders
-            if reminder_date.date() >= today:
-                upcoming.append({
-                    'medicine_id': medicine_id,
-                    'medicine_name': medicine['name'],
-                    'medicine_dosage': medicine['dosage'],
-                    'reminder_date': reminder_date.date().isoformat(),
-                    'empty_date': empty_date.date().isoformat(),
-                    'reminder_time': reminder.get('reminder_time', '08:00')
-                })
-        
-        # Sort by reminder date
-        upcoming.sort(key=lambda x: x['reminder_date'])
-        return upcoming
+            self._in_flight.update(keys)
+            try:
+                batch = await self._run(self.patients.pending_batch, keys)
+                if not batch:
+                    continue
+                errors = await self._run(self.client.send_batch, batch)
+                for patient_id, key, delay in await self._run(self.patients.record_deliveries, batch, errors):
+                    enqueue(patient_id, key, delay)
+            except Exception as e:
+                # Keep the worker alive and try the batch again; the idempotency key covers resends
+                logger.error(f"Error delivering {len(keys)} notifications, retrying in {SCHEDULER_RETRY_DELAY}s: {e}")
+                for patient_id, key in keys:
+                    enqueue(patient_id, key, SCHEDULER_RETRY_DELAY)
+            finally:
+                self._in_flight.difference_update(keys)
+    
+    def metrics(self) -> Dict:
+        """Report delivery throughput, latency and rate limiting"""
+        return self.client.metrics.snapshot()
+    
+    def close(self):
+        """Wait for deliveries in progress to finish, then release the client's connections"""
+        self._executor.shutdown(wait=True)
+        self.client.close()
+
+
+class AsyncMedicineReminder:
+    """Awaitable facade over the patients' MedicineReminders for use on an asyncio event loop.
+
+    Each call runs on a bounded thread pool, so storage I/O never blocks the
+    loop and concurrent requests overlap; MedicineReminder's own locking keeps
+    the shared state consistent.
+    """
+    
+    def __init__(self, patients: PatientRegistry, max_workers: int = EXECUTOR_WORKERS, shared: bool = False):
+        self.patients = patients
+        # Other processes write to the same storage, so shards are synced before use
+        self.shared = shared
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="medicine-reminder")
+        self.dispatcher = NotificationDispatcher(
+            patients, create_delivery(WEBHOOK_URL, DELIVERY_RATE_LIMIT, DELIVERY_RATE_BURST, DELIVERY_WORKERS)
+        )
+        # Reminder scheduler and notification dispatcher tasks
+        self._scheduler_tasks: List[asyncio.Task] = []
+        # Number of server lifespans currently relying on the scheduler tasks
+        self._scheduler_users = 0
+    
+    async def _run(self, method, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(method, *args))
+    
+    async def _run_for_patient(self, patient_id: str, method_name: str, *args):
+        """Run a MedicineReminder method on a patient's shard.
+        
+        Only adding medicines creates a patient; other calls on a patient
+        without data run on an empty view that is never saved, so they
+        validate and answer exactly as for a patient with no medicines.
+        """
+        def call():
+            if method_name == 'add_medicines':
+                MedicineReminder.validate_medicines(*args)
+            shard = self.patients.shard(patient_id, create=method_name in ('add_medicine', 'add_medicines'))
+            if shard is None:
+                shard = MedicineReminder(MemoryBackend(), patient_id, ReminderSchedule())
+            if self.shared:
+                shard.sync()
+            return getattr(shard, method_name)(*args)
+        return await self._run(call)
+    
+    async def add_medicine(self, patient_id: str, name: str, dosage: str, quantity: int,
+                           refill_period_days: int) -> Medicine:
+        return await self._run_for_patient(patient_id, 'add_medicine', name, dosage, quantity, refill_period_days)
+    
+    async def add_medicines(self, patient_id: str, medicines: List[Dict]) -> List[Medicine]:
+        return await self._run_for_patient(patient_id, 'add_medicines', medicines)
+    
+    async def list_medicines(self, patient_id: str, limit: Optional[int] = None, cursor: Optional[str] = None,
+                             name_prefix: str = '', added_from: Optional[str] = None,
+                             added_to: Optional[str] = None) -> Dict:
+        return await self._run_for_patient(patient_id, 'list_medicines', limit, cursor, name_prefix, added_from, added_to)
+    
+    async def set_reminder(self, patient_id: str, medicine_id: str, days_before_empty: int,
+                           reminder_time: str) -> Reminder:
+        return await self._run_for_patient(patient_id, 'set_reminder', medicine_id, days_before_empty, reminder_time)
+    
+    async def set_reminders(self, patient_id: str, reminders: List[Dict]) -> List[Reminder]:
+        return await self._run_for_patient(patient_id, 'set_reminders', reminders)
+    
+    async def order_refill(self, patient_id: str, medicine_id: str) -> Order:
+        return await self._run_for_patient(patient_id, 'order_refill', medicine_id)
+    
+    async def order_refills(self, patient_id: str, medicine_ids: List[str]) -> List[Order]:
+        return await self._run_for_patient(patient_id, 'order_refills', medicine_ids)
+    
+    async def get_upcoming_reminders(self, patient_id: str, limit: Optional[int] = None) -> List[Dict]:
+        return await self._run_for_patient(patient_id, 'get_upcoming_reminders', limit)
+    
+    async def get_status(self) -> Dict:
+        status = await self._run(self.patients.get_status)
+        status['delivery'] = self.dispatcher.metrics()
+        return status
+    
+    async def run_scheduler(self):
+        """Send reminders as they fall due, sleeping until the next one; runs until cancelled"""
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        self.patients.schedule.on_change = lambda: loop.call_soon_threadsafe(wakeup.set)
+        try:
+            while True:
+                timeout = self.patients.schedule.seconds_until_next_fire()
+                if self.shared:
+                    timeout = min(timeout, SHARED_SCHEDULER_POLL)
+                if timeout > 0:
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                wakeup.clear()
+                try:
+                    if self.shared:
+                        await self._run(self.patients.sync)
+                    await self._run(self.patients._check_reminders)
+                except Exception as e:
+                    # A storage error must not stop reminders for good
+                    logger.error(f"Reminder scan failed, retrying in {SCHEDULER_RETRY_DELAY}s: {e}")
+                    await asyncio.sleep(SCHEDULER_RETRY_DELAY)
+        finally:
+            self.patients.schedule.on_change = None
+    
+    @property
+    def scheduler_running(self) -> bool:
+        """Whether the scheduler and dispatcher tasks are both still alive"""
+        return bool(self._scheduler_tasks) and all(not task.done() for task in self._scheduler_tasks)
+    
+    def start_scheduler(self):
+        """Start the scheduler and notification dispatcher on the running loop unless they are running"""
+        self._scheduler_users += 1
+        if not self._scheduler_tasks or all(task.done() for task in self._scheduler_tasks):
+            self._scheduler_tasks = [
+                asyncio.create_task(self.run_scheduler(), name="reminder-scheduler"),
+                asyncio.create_task(self.dispatcher.run(), name="notification-dispatcher"),
+            ]
+            logger.info("Reminder scheduler started")
+    
+    async def stop_scheduler(self):
+        """Stop the scheduler and notification dispatcher once their last user has stopped"""
+        self._scheduler_users -= 1
+        if self._scheduler_users > 0 or not self._scheduler_tasks:
+            return
+        tasks, self._scheduler_tasks = self._scheduler_tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        logger.info("Reminder scheduler stopped")
+    
+    def close(self):
+        """Finish in-flight calls and deliveries, then close every patient's MedicineReminder"""
+        self._executor.shutdown(wait=True)
+        self.dispatcher.close()
+        self.patients.close()
 
 
 # Initialize the MedicineReminder system
-medicine_reminder = MedicineReminder()
+patients = PatientRegistry()
+medicine_reminder = patients.shard(DEFAULT_PATIENT_ID)
+async_medicine_reminder = AsyncMedicineReminder(patients, shared=SHARED_STORAGE)
+# Flush pending writes when the process exits
+atexit.register(async_medicine_reminder.close)
 
 # Define tool functions
-def add_medicine(name: str, dosage: str, quantity: int, refill_period_days: int) -> Dict:
+@METRICS.timed_tool("add_medicine")
+async def add_medicine(name: str, dosage: str, quantity: int, refill_period_days: int, patient_id: str = DEFAULT_PATIENT_ID) -> Dict:
     """
     Add a new medicine to track with name, dosage, and refill schedule.
     
@@ -248,16 +1302,47 @@ def add_medicine(name: str, dosage: str, quantity: int, refill_period_days: int)
         dosage: The dosage of the medicine (e.g., "10mg")
         quantity: The quantity of pills/units in a refill
         refill_period_days: How many days a refill typically lasts
+        patient_id: The patient whose records to use (default: "default")
+    """
+    medicine = await async_medicine_reminder.add_medicine(patient_id, name, dosage, quantity, refill_period_days)
+    return medicine.to_dict()
+
+@METRICS.timed_tool("add_medicines")
+async def add_medicines(medicines: List[Dict[str, Any]], patient_id: str = DEFAULT_PATIENT_ID) -> List[Dict]:
+    """
+    Add several medicines to track in one call.
+    
+    Args:
+        medicines: List of medicines, each with name, dosage, quantity and refill_period_days
+        patient_id: The patient whose records to use (default: "default")
     """
-    return medicine_reminder.add_medicine(name, dosage, quantity, refill_period_days)
+    return [medicine.to_dict() for medicine in await async_medicine_reminder.add_medicines(patient_id, medicines)]
 
-def list_medicines() -> List[Dict]:
+@METRICS.timed_tool("list_medicines")
+async def list_medicines(limit: Optional[int] = None, cursor: Optional[str] = None,
+                         name_prefix: str = '', added_from: Optional[str] = None, added_to: Optional[str] = None,
+                         fields: Optional[List[str]] = None,
+                         patient_id: str = DEFAULT_PATIENT_ID) -> Dict:
     """
-    List all tracked medicines with their details.
+    List tracked medicines in name order, one page at a time.
+    
+    Args:
+        limit: The number of medicines per page (default: 100, at most 1000)
+        cursor: The next_cursor of the previous page, to continue after it
+        name_prefix: Only list medicines whose name starts with this (case-insensitive)
+        added_from: Only list medicines added on or after this date (YYYY-MM-DD)
+        added_to: Only list medicines added on or before this date (YYYY-MM-DD)
+        fields: Only return these fields of each medicine; 'id' is always included
+        patient_id: The patient whose medicines to list (default: "default")
     """
-    return medicine_reminder.list_medicines()
+    page = await async_medicine_reminder.list_medicines(patient_id, limit, cursor, name_prefix, added_from, added_to)
+    medicines = [medicine.to_dict() for medicine in page['medicines']]
+    if fields is not None:
+        medicines = [{field: medicine[field] for field in ['id', *fields] if field in medicine} for medicine in medicines]
+    return {'medicines': medicines, 'next_cursor': page['next_cursor']}
 
-def set_reminder(medicine_id: str, days_before_empty: int, reminder_time: str) -> Dict:
+@METRICS.timed_tool("set_reminder")
+async def set_reminder(medicine_id: str, days_before_empty: int, reminder_time: str, patient_id: str = DEFAULT_PATIENT_ID) -> Dict:
     """
     Set or update a reminder for a specific medicine.
     
@@ -265,70 +1350,244 @@ def set_reminder(medicine_id: str, days_before_empty: int, reminder_time: str) -
         medicine_id: The ID of the medicine to set a reminder for
         days_before_empty: How many days before running out to send a reminder
         reminder_time: The time of day to send the reminder (format: "HH:MM")
+        patient_id: The patient whose records to use (default: "default")
     """
-    return medicine_reminder.set_reminder(medicine_id, days_before_empty, reminder_time)
+    reminder = await async_medicine_reminder.set_reminder(patient_id, medicine_id, days_before_empty, reminder_time)
+    return reminder.to_dict()
 
-def order_refill(medicine_id: str) -> Dict:
+@METRICS.timed_tool("order_refill")
+async def order_refill(medicine_id: str, patient_id: str = DEFAULT_PATIENT_ID) -> Dict:
     """
     Place a refill order for a specific medicine.
     
     Args:
         medicine_id: The ID of the medicine to order a refill for
+        patient_id: The patient whose records to use (default: "default")
     """
-    return medicine_reminder.order_refill(medicine_id)
+    order = await async_medicine_reminder.order_refill(patient_id, medicine_id)
+    return order.to_dict()
 
-def get_upcoming_reminders() -> List[Dict]:
+@METRICS.timed_tool("set_reminders")
+async def set_reminders(reminders: List[Dict[str, Any]], patient_id: str = DEFAULT_PATIENT_ID) -> List[Dict]:
+    """
+    Set or update reminders for several medicines in one call.
+    
+    Args:
+        reminders: List of reminders, each with medicine_id, days_before_empty and reminder_time
+        patient_id: The patient whose records to use (default: "default")
+    """
+    return [reminder.to_dict() for reminder in await async_medicine_reminder.set_reminders(patient_id, reminders)]
+
+@METRICS.timed_tool("order_refills")
+async def order_refills(medicine_ids: List[str], patient_id: str = DEFAULT_PATIENT_ID) -> List[Dict]:
+    """
+    Place refill orders for several medicines in one call.
+    
+    Args:
+        medicine_ids: The IDs of the medicines to order refills for
+        patient_id: The patient whose records to use (default: "default")
+    """
+    return [order.to_dict() for order in await async_medicine_reminder.order_refills(patient_id, medicine_ids)]
+
+@METRICS.timed_tool("get_upcoming_reminders")
+async def get_upcoming_reminders(limit: Optional[int] = None, patient_id: str = DEFAULT_PATIENT_ID) -> List[Dict]:
     """
     Get a list of upcoming medication reminders.
+    
+    Args:
+        limit: Return only the first N reminders (default: all, at most 1000)
+        patient_id: The patient whose records to use (default: "default")
     """
-    return medicine_reminder.get_upcoming_reminders()
+    return await async_medicine_reminder.get_upcoming_reminders(patient_id, limit)
 
-# Create FastMCP server
-server = FastMCP("Medicine Reminder")
+@METRICS.timed_tool("get_status")
+async def get_status() -> Dict:
+    """
+    Get the server's storage backend, YAML implementation and record counts summed over all patients.
+    """
+    return await async_medicine_reminder.get_status()
+
+@METRICS.timed_tool("get_metrics")
+async def get_metrics() -> Dict:
+    """
+    Get call counts, errors and p50/p95/p99 latency of each tool, reminder scan timings and counters.
+    """
+    summary = METRICS.summary()
+    summary['delivery'] = async_medicine_reminder.dispatcher.metrics()
+    return summary
+
+@contextlib.contextmanager
+def scheduler_lock() -> Iterator[bool]:
+    """Yield whether this process should run the scheduler.
+    
+    When several server processes share the storage, only the one holding
+    the scheduler lock file sends reminders.
+    """
+    if not SHARED_STORAGE or fcntl is None:
+        yield True
+        return
+    
+    DATA_DIR.mkdir(exist_ok=True)
+    with open(DATA_DIR / "scheduler.lock", 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+@contextlib.asynccontextmanager
+async def lifespan(server: FastMCP):
+    """Run the reminder scheduler on the server's event loop while it is serving"""
+    with scheduler_lock() as owner:
+        if owner:
+            async_medicine_reminder.start_scheduler()
+        else:
+            # Another process sends the reminders, so nothing would ever pop this one's schedule
+            patients.schedule.disable()
+        try:
+            yield
+        finally:
+            if owner:
+                await async_medicine_reminder.stop_scheduler()
+
+# Create FastMCP server; network transports run the scheduler for the whole
+# app rather than per session, and keep no session state so any process can
+# serve any request
+server = FastMCP(
+    "Medicine Reminder",
+    lifespan=lifespan if TRANSPORT == "stdio" else None,
+    stateless_http=True,
+)
+
+def create_http_app():
+    """Build the ASGI app of the network transport; uvicorn calls this in each worker process"""
+    app = server.streamable_http_app() if TRANSPORT == "streamable-http" else server.sse_app()
+    session_lifespan = app.router.lifespan_context
+    
+    @contextlib.asynccontextmanager
+    async def app_lifespan(app):
+        async with session_lifespan(app), lifespan(server):
+            yield
+    
+    app.router.lifespan_context = app_lifespan
+    return app
+
+@server.custom_route("/health", methods=["GET"])
+async def health(request: Request) -> JSONResponse:
+    """Report that this server process is up, for load balancer health checks"""
+    return JSONResponse({
+        'status': 'ok',
+        'pid': os.getpid(),
+        'transport': TRANSPORT,
+        'scheduler': async_medicine_reminder.scheduler_running,
+    })
+
+@server.custom_route("/metrics", methods=["GET"])
+async def prometheus_metrics(request: Request) -> PlainTextResponse:
+    """Export this process's metrics in the Prometheus text format"""
+    return PlainTextResponse(METRICS.render_prometheus(), media_type="text/plain; version=0.0.4")
 
 # Register tools with the server
 @server.tool(
     name="add_medicine",
     description="Add a new medicine to track with refill reminders."
 )
-def add_medicine_tool(name: str, dosage: str, quantity: int, refill_period_days: int):
+async def add_medicine_tool(name: str, dosage: str, quantity: int, refill_period_days: int, patient_id: str = DEFAULT_PATIENT_ID):
     """Add a new medicine to track with refill reminders."""
-    return add_medicine(name, dosage, quantity, refill_period_days)
+    return await add_medicine(name, dosage, quantity, refill_period_days, patient_id)
+
+@server.tool(
+    name="add_medicines",
+    description="Add several medicines to track in a single call."
+)
+async def add_medicines_tool(medicines: List[Dict[str, Any]], patient_id: str = DEFAULT_PATIENT_ID):
+    """Add several medicines to track in a single call."""
+    return await add_medicines(medicines, patient_id)
 
 @server.tool(
     name="list_medicines",
-    description="List all tracked medicines."
+    description="List tracked medicines one page at a time, optionally filtered by name prefix and added date."
 )
-def list_medicines_tool():
-    """List all tracked medicines."""
-    return list_medicines()
+async def list_medicines_tool(limit: Optional[int] = None, cursor: Optional[str] = None,
+                              name_prefix: str = '', added_from: Optional[str] = None, added_to: Optional[str] = None,
+                              fields: Optional[List[str]] = None,
+                              patient_id: str = DEFAULT_PATIENT_ID):
+    """List tracked medicines one page at a time, optionally filtered by name prefix and added date."""
+    return await list_medicines(limit, cursor, name_prefix, added_from, added_to, fields, patient_id)
 
 @server.tool(
     name="set_reminder",
     description="Set a reminder for a specific medicine."
 )
-def set_reminder_tool(medicine_id: str, days_before_empty: int, reminder_time: str):
+async def set_reminder_tool(medicine_id: str, days_before_empty: int, reminder_time: str, patient_id: str = DEFAULT_PATIENT_ID):
     """Set a reminder for a specific medicine."""
-    return set_reminder(medicine_id, days_before_empty, reminder_time)
+    return await set_reminder(medicine_id, days_before_empty, reminder_time, patient_id)
 
 @server.tool(
     name="order_refill",
     description="Order a refill for a specific medicine."
 )
-def order_refill_tool(medicine_id: str):
+async def order_refill_tool(medicine_id: str, patient_id: str = DEFAULT_PATIENT_ID):
     """Order a refill for a specific medicine."""
-    return order_refill(medicine_id)
+    return await order_refill(medicine_id, patient_id)
+
+@server.tool(
+    name="set_reminders",
+    description="Set reminders for several medicines in a single call."
+)
+async def set_reminders_tool(reminders: List[Dict[str, Any]], patient_id: str = DEFAULT_PATIENT_ID):
+    """Set reminders for several medicines in a single call."""
+    return await set_reminders(reminders, patient_id)
+
+@server.tool(
+    name="order_refills",
+    description="Order refills for several medicines in a single call."
+)
+async def order_refills_tool(medicine_ids: List[str], patient_id: str = DEFAULT_PATIENT_ID):
+    """Order refills for several medicines in a single call."""
+    return await order_refills(medicine_ids, patient_id)
 
 @server.tool(
     name="get_upcoming_reminders",
     description="Get a list of upcoming medicine refill reminders."
 )
-def get_upcoming_reminders_tool():
+async def get_upcoming_reminders_tool(limit: Optional[int] = None, patient_id: str = DEFAULT_PATIENT_ID):
     """Get a list of upcoming medicine refill reminders."""
-    return get_upcoming_reminders()
+    return await get_upcoming_reminders(limit, patient_id)
+
+@server.tool(
+    name="get_status",
+    description="Get the storage backend, YAML implementation and record counts."
+)
+async def get_status_tool():
+    """Get the storage backend, YAML implementation and record counts."""
+    return await get_status()
+
+@server.tool(
+    name="get_metrics",
+    description="Get per-tool call counts, errors and latency percentiles, reminder scan timings and storage counters."
+)
+async def get_metrics_tool():
+    """Get per-tool call counts, errors and latency percentiles, reminder scan timings and storage counters."""
+    return await get_metrics()
 
 
 if __name__ == "__main__":
-    logger.info("Starting Medicine Reminder MCP Server")
-    import asyncio
-    asyncio.run(server.run_stdio_async())
\ No newline at end of file
+    if TRANSPORT not in ("stdio", "streamable-http", "sse"):
+        raise SystemExit(f"Unknown transport: {TRANSPORT}")
+    if HTTP_WORKERS > 1 and (TRANSPORT != "streamable-http" or STORAGE_MODE != "sqlite"):
+        raise SystemExit("Multiple server processes require the streamable-http transport and sqlite storage")
+    
+    logger.info(f"Starting Medicine Reminder MCP Server ({TRANSPORT})")
+    if TRANSPORT == "stdio":
+        if METRICS_PORT:
+            METRICS.serve(HTTP_HOST, METRICS_PORT)
+        asyncio.run(server.run_stdio_async())
+    elif HTTP_WORKERS > 1:
+        uvicorn.run("main:create_http_app", factory=True, host=HTTP_HOST, port=HTTP_PORT, workers=HTTP_WORKERS)
+    else:
+        uvicorn.run(create_http_app(), host=HTTP_HOST, port=HTTP_PORT)
\ No newline at end of file
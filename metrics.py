@@ -0,0 +1,215 @@
+import time
+import bisect
+import logging
+import functools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Prefix of every exported metric name
+METRIC_PREFIX = 'medicine_reminder'
+
+# Upper bounds in seconds of the latency buckets: 100µs doubling up to about 26s
+LATENCY_BUCKETS = tuple(0.0001 * 2 ** i for i in range(19))
+
+# Help text of the counters, by name
+COUNTER_HELP = {
+    'scan_rows_examined': 'Schedule entries examined by reminder scans',
+    'reminders_fired': 'Reminders whose notification was queued',
+    'storage_bytes_written': 'Bytes written to data files and journals',
+}
+
+
+class Histogram:
+    """Latency histogram with fixed buckets; percentiles are interpolated within a bucket"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        # One count per bucket plus the +Inf bucket
+        self._counts = [0] * (len(buckets) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += value
+
+    def snapshot(self) -> Tuple[List[int], int, float]:
+        """Return (per-bucket counts, total count, sum of observed values)"""
+        with self._lock:
+            return list(self._counts), self._count, self._sum
+
+    def percentile(self, q: float) -> float:
+        """Estimate the value below which a fraction `q` of observations fall"""
+        counts, total, _ = self.snapshot()
+        if not total:
+            return 0.0
+        rank = q * total
+        cumulative = 0
+        for index, count in enumerate(counts):
+            if count and cumulative + count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else lower
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+
+def _labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    return ','.join(f'{key}="{value}"' for key, value in labels)
+
+
+class Metrics:
+    """Process-wide counters and latency histograms, exported as a summary or Prometheus text"""
+
+    def __init__(self):
+        self._tool_latency: Dict[str, Histogram] = {}
+        self._tool_errors: Dict[str, int] = {}
+        self.scan_latency = Histogram()
+        # (counter name, sorted labels) -> value
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._lock = threading.Lock()
+
+    def observe_tool(self, tool: str, seconds: float, error: bool = False):
+        """Record one tool call"""
+        with self._lock:
+            histogram = self._tool_latency.get(tool)
+            if histogram is None:
+                histogram = self._tool_latency[tool] = Histogram()
+                self._tool_errors[tool] = 0
+            if error:
+                self._tool_errors[tool] += 1
+        histogram.observe(seconds)
+
+    def increment(self, name: str, value: float = 1, **labels: str):
+        """Add to a counter"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def timed_tool(self, tool: str) -> Callable:
+        """Decorate an async tool function to record its calls, errors and latency"""
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                error = True
+                try:
+                    result = await func(*args, **kwargs)
+                    error = False
+                    return result
+                finally:
+                    self.observe_tool(tool, time.perf_counter() - started, error)
+            return wrapper
+        return decorator
+
+    def summary(self) -> Dict:
+        """Report call counts, errors and p50/p95/p99 latency per tool, scan timings and counters"""
+        with self._lock:
+            tools = dict(self._tool_latency)
+            errors = dict(self._tool_errors)
+            counters = dict(self._counters)
+
+        def latency(histogram: Histogram) -> Dict:
+            _, count, total = histogram.snapshot()
+            return {
+                'calls': count,
+                'p50_ms': round(histogram.percentile(0.50) * 1000, 3),
+                'p95_ms': round(histogram.percentile(0.95) * 1000, 3),
+                'p99_ms': round(histogram.percentile(0.99) * 1000, 3),
+                'mean_ms': round(total / count * 1000, 3) if count else 0.0,
+            }
+
+        summary = {
+            'tools': {tool: dict(latency(histogram), errors=errors[tool]) for tool, histogram in sorted(tools.items())},
+            'scan': latency(self.scan_latency),
+            'counters': {},
+        }
+        for (name, labels), value in sorted(counters.items()):
+            key = f"{name}{{{_labels(labels)}}}" if labels else name
+            summary['counters'][key] = value
+        return summary
+
+    def render_prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        with self._lock:
+            tools = sorted(self._tool_latency.items())
+            errors = dict(self._tool_errors)
+            counters = sorted(self._counters.items())
+
+        lines = []
+
+        def histogram_lines(name: str, histogram: Histogram, labels: str = ''):
+            counts, count, total = histogram.snapshot()
+            prefix = f"{labels}," if labels else ''
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{{prefix}le="{bound:g}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {count}')
+            suffix = f"{{{labels}}}" if labels else ''
+            lines.append(f'{name}_sum{suffix} {total}')
+            lines.append(f'{name}_count{suffix} {count}')
+
+        name = f"{METRIC_PREFIX}_tool_duration_seconds"
+        lines.append(f"# HELP {name} Latency of MCP tool calls")
+        lines.append(f"# TYPE {name} histogram")
+        for tool, histogram in tools:
+            histogram_lines(name, histogram, f'tool="{tool}"')
+
+        name = f"{METRIC_PREFIX}_tool_errors_total"
+        lines.append(f"# HELP {name} MCP tool calls that raised an error")
+        lines.append(f"# TYPE {name} counter")
+        for tool, _ in tools:
+            lines.append(f'{name}{{tool="{tool}"}} {errors[tool]}')
+
+        name = f"{METRIC_PREFIX}_scan_duration_seconds"
+        lines.append(f"# HELP {name} Duration of reminder scans")
+        lines.append(f"# TYPE {name} histogram")
+        histogram_lines(name, self.scan_latency)
+
+        declared = set()
+        for (counter, labels), value in counters:
+            name = f"{METRIC_PREFIX}_{counter}_total"
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# HELP {name} {COUNTER_HELP.get(counter, counter)}")
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{{{_labels(labels)}}} {value:g}" if labels else f"{name} {value:g}")
+
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, host: str, port: int) -> ThreadingHTTPServer:
+        """Serve the Prometheus text at /metrics from a background thread"""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+        thread.start()
+        logger.info(f"Serving metrics at http://{host}:{port}/metrics")
+        return server
+
+
+# Metrics of this process
+METRICS = Metrics()
@@ -0,0 +1,183 @@
+import time
+import random
+import logging
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Delivery statuses of a notification record
+PENDING = 'pending'
+DELIVERED = 'delivered'
+FAILED = 'failed'
+
+# Window in seconds over which the current delivery throughput is measured
+THROUGHPUT_WINDOW = 60
+
+
+def notification_id(medicine_id: str, reminder_date: str) -> str:
+    """Return the id of a medicine's notification for a reminder date.
+
+    The id is deterministic, so re-running a scan never queues the same
+    reminder twice, and it doubles as the idempotency key sent to the provider.
+    """
+    return f"ntf_{medicine_id}_{reminder_date.replace('-', '')}"
+
+
+def retry_delay(attempts: int, base: float, maximum: float) -> float:
+    """Return the backoff before the next attempt: exponential with full jitter"""
+    return random.uniform(0, min(maximum, base * 2 ** (attempts - 1)))
+
+
+class TokenBucket:
+    """Rate limiter shared by delivery threads: `rate` tokens per second, up to `burst` saved up"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        # Below one token the bucket could never hold enough to send
+        self.burst = max(1.0, burst or rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take one token, sleeping until one is available; returns the seconds waited"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class DeliveryMetrics:
+    """Counts deliveries and measures their throughput and latency"""
+
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.batches = 0
+        self.throttled_seconds = 0.0
+        self._latency_total = 0.0
+        self._started = time.monotonic()
+        # Completion times of recent successful deliveries
+        self._recent = deque()
+        self._lock = threading.Lock()
+
+    def record(self, error: Optional[str], latency: float, throttled: float = 0.0):
+        with self._lock:
+            now = time.monotonic()
+            if error is None:
+                self.sent += 1
+                self._recent.append(now)
+            else:
+                self.failed += 1
+            self._latency_total += latency
+            self.throttled_seconds += throttled
+
+    def record_batch(self):
+        with self._lock:
+            self.batches += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            now = time.monotonic()
+            cutoff = now - THROUGHPUT_WINDOW
+            while self._recent and self._recent[0] < cutoff:
+                self._recent.popleft()
+            attempts = self.sent + self.failed
+            # Measured over the window, or the uptime while it is shorter
+            span = now - max(cutoff, self._started)
+            return {
+                'sent': self.sent,
+                'failed': self.failed,
+                'batches': self.batches,
+                'messages_per_second': round(len(self._recent) / span, 3) if span > 0 else 0.0,
+                'average_latency_ms': round(self._latency_total / attempts * 1000, 3) if attempts else 0.0,
+                'throttled_seconds': round(self.throttled_seconds, 3),
+            }
+
+
+class LogDelivery:
+    """Delivers notifications by logging them (simulated WhatsApp delivery)"""
+
+    def __init__(self):
+        self.metrics = DeliveryMetrics()
+
+    def send_batch(self, notifications: List[Dict]) -> List[Optional[str]]:
+        """Send notifications in order; returns None or the error message for each"""
+        self.metrics.record_batch()
+        for notification in notifications:
+            logger.info(f"WhatsApp message to patient {notification['patient_id']}: {notification['message']}")
+            self.metrics.record(None, 0.0)
+        return [None] * len(notifications)
+
+    def close(self):
+        pass
+
+
+class WhatsAppClient:
+    """Delivers notifications by POSTing them as JSON to an HTTP endpoint.
+
+    One keep-alive session is shared by all delivery threads, with up to
+    `pool_size` pooled connections, and every request first takes a token
+    from a bucket refilled at `rate` per second (0 disables the limit).
+    """
+
+    def __init__(self, url: str, rate: float = 0, burst: Optional[float] = None,
+                 pool_size: int = 10, timeout: float = 10):
+        self.url = url
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self.metrics = DeliveryMetrics()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def send(self, notification: Dict) -> Optional[str]:
+        """Send one notification; returns None on success or the error message"""
+        throttled = self.bucket.acquire() if self.bucket is not None else 0.0
+        started = time.monotonic()
+        try:
+            response = self.session.post(
+                self.url,
+                json={
+                    'patient_id': notification['patient_id'],
+                    'medicine_id': notification['medicine_id'],
+                    'message': notification['message'],
+                },
+                headers={'Idempotency-Key': f"{notification['patient_id']}:{notification['id']}"},
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+            error = None
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        self.metrics.record(error, time.monotonic() - started, throttled)
+        return error
+
+    def send_batch(self, notifications: List[Dict]) -> List[Optional[str]]:
+        """Send notifications in order over the pooled session; returns None or the error message for each"""
+        self.metrics.record_batch()
+        return [self.send(notification) for notification in notifications]
+
+    def close(self):
+        self.session.close()
+
+
+def create_delivery(url: Optional[str], rate: float = 0, burst: Optional[float] = None, pool_size: int = 10):
+    """Create the delivery client: WhatsAppClient when a URL is configured, LogDelivery otherwise"""
+    if url:
+        return WhatsAppClient(url, rate, burst, pool_size)
+    return LogDelivery()
@@ -0,0 +1,136 @@
+import sys
+from dataclasses import dataclass
+from typing import Any, ClassVar, Dict, Optional, Tuple, Union
+
+# Defaults used when a stored record leaves a field out
+DEFAULT_QUANTITY = 30
+DEFAULT_REFILL_PERIOD_DAYS = 30
+DEFAULT_DAYS_BEFORE_EMPTY = 5
+DEFAULT_REMINDER_TIME = '08:00'
+
+
+class _Record:
+    """Base of the record types: interns repeated strings and converts to and from dicts.
+
+    Records are frozen, so a change always replaces the record
+    (dataclasses.replace) and readers never see a half-applied update.
+    """
+
+    __slots__ = ()
+    # Fields whose values repeat across many records (names, dosages, dates),
+    # so every record shares one copy of each distinct string
+    _interned: ClassVar[Tuple[str, ...]] = ()
+
+    def __post_init__(self):
+        for name in self._interned:
+            value = getattr(self, name)
+            if type(value) is str:
+                object.__setattr__(self, name, sys.intern(value))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the record as a dict, leaving out optional fields that are not set"""
+        data = {}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if value is not None:
+                data[name] = value
+        return data
+
+
+@dataclass(frozen=True, slots=True)
+class Medicine(_Record):
+    id: str
+    patient_id: Optional[str]
+    name: str
+    dosage: str
+    quantity: int
+    refill_period_days: int
+    added_date: Optional[str]
+    last_refill_date: Optional[str]
+
+    _interned: ClassVar[Tuple[str, ...]] = ('patient_id', 'name', 'dosage', 'added_date', 'last_refill_date')
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Medicine':
+        return cls(
+            id=data['id'],
+            patient_id=data.get('patient_id'),
+            name=data['name'],
+            dosage=data['dosage'],
+            quantity=data.get('quantity', DEFAULT_QUANTITY),
+            refill_period_days=data.get('refill_period_days', DEFAULT_REFILL_PERIOD_DAYS),
+            added_date=data.get('added_date'),
+            # Records written before refills were tracked count from the added date
+            last_refill_date=data.get('last_refill_date', data.get('added_date')),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class Reminder(_Record):
+    medicine_id: str
+    patient_id: Optional[str]
+    days_before_empty: int
+    reminder_time: str
+    last_reminded_date: Optional[str] = None
+
+    _interned: ClassVar[Tuple[str, ...]] = ('patient_id', 'reminder_time', 'last_reminded_date')
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Reminder':
+        return cls(
+            medicine_id=data['medicine_id'],
+            patient_id=data.get('patient_id'),
+            days_before_empty=data.get('days_before_empty', DEFAULT_DAYS_BEFORE_EMPTY),
+            reminder_time=data.get('reminder_time', DEFAULT_REMINDER_TIME),
+            last_reminded_date=data.get('last_reminded_date'),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class Order(_Record):
+    id: str
+    patient_id: Optional[str]
+    medicine_id: str
+    medicine_name: str
+    medicine_dosage: str
+    order_date: str
+    status: str
+
+    _interned: ClassVar[Tuple[str, ...]] = ('patient_id', 'medicine_name', 'medicine_dosage', 'order_date', 'status')
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Order':
+        return cls(
+            id=data['id'],
+            patient_id=data.get('patient_id'),
+            medicine_id=data['medicine_id'],
+            medicine_name=data['medicine_name'],
+            medicine_dosage=data['medicine_dosage'],
+            order_date=data['order_date'],
+            status=data.get('status', 'placed'),
+        )
+
+
+Record = Union[Medicine, Reminder, Order]
+
+# Record type of each store; other stores (notifications) keep plain dicts
+RECORD_TYPES = {'medicines': Medicine, 'reminders': Reminder, 'orders': Order}
+
+
+def record_from_dict(store: str, data: Dict[str, Any]) -> Union[Record, Dict[str, Any]]:
+    """Turn a stored dict into the record type of its store"""
+    record_type = RECORD_TYPES.get(store)
+    return data if record_type is None else record_type.from_dict(data)
+
+
+def records_from_dicts(store: str, data: Dict[str, Dict[str, Any]]) -> Dict[str, Union[Record, Dict[str, Any]]]:
+    """Turn a loaded store of dicts into records of its type"""
+    record_type = RECORD_TYPES.get(store)
+    if record_type is None:
+        return data
+    return {key: record_type.from_dict(value) for key, value in data.items()}
+
+
+def record_to_dict(record: Union[Record, Dict[str, Any]]) -> Dict[str, Any]:
+    """Turn a record into the dict that is stored or returned to MCP clients"""
+    return record if isinstance(record, dict) else record.to_dict()
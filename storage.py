@@ -0,0 +1,1003 @@
+import os
+import json
+import stat
+import contextlib
+import uuid
+import sqlite3
+import tempfile
+import logging
+import datetime
+import threading
+import yaml
+from typing import IO, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, MutableMapping
+from pathlib import Path
+
+from metrics import METRICS
+from records import record_from_dict, record_to_dict, records_from_dicts
+
+logger = logging.getLogger(__name__)
+
+# Prefer the libyaml C implementation; the pure-Python one reads and writes the same format
+try:
+    from yaml import CSafeLoader as YamlLoader, CSafeDumper as YamlDumper
+    YAML_IMPLEMENTATION = 'libyaml'
+except ImportError:
+    from yaml import SafeLoader as YamlLoader, SafeDumper as YamlDumper
+    YAML_IMPLEMENTATION = 'python'
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional; binary snapshots are unavailable without it
+    msgpack = None
+
+# Binary snapshots start with this magic and a format version byte
+SNAPSHOT_MAGIC = b'MRSNAP'
+SNAPSHOT_VERSION = 1
+
+# Names of the stores kept by MedicineReminder
+STORES = ('medicines', 'reminders', 'orders', 'notifications')
+
+# File name of the SQLite database holding every patient's records
+SQLITE_DATABASE = "medicine_reminder.db"
+
+# Rows kept in the SQLite change log, and commits between trims of it; a
+# process that falls further behind reloads everything instead
+CHANGE_LOG_RETAIN = 100000
+CHANGE_LOG_TRIM_INTERVAL = 1000
+
+
+# Permissions of newly created files: read-write for everyone, less the umask
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+NEW_FILE_MODE = 0o666 & ~_UMASK
+
+
+class StorageLoadError(RuntimeError):
+    """A store could not be read; it must not be overwritten until the problem is fixed"""
+
+
+def _fsync_path(path: Path):
+    """Flush a file or directory to disk"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path: Path, write: Callable[[IO], None], binary: bool = False, fsync: bool = True) -> int:
+    """Write a file through a temporary file and rename, so a crash never leaves it partial.
+
+    The file keeps the permissions of the one it replaces. Returns the size
+    of the written file in bytes.
+    """
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = NEW_FILE_MODE
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix='.tmp')
+    try:
+        # mkstemp creates the file readable by its owner only
+        os.fchmod(fd, mode)
+        with os.fdopen(fd, 'wb' if binary else 'w') as f:
+            write(f)
+            f.flush()
+            size = os.fstat(f.fileno()).st_size
+            if fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+    if fsync:
+        # Make the rename itself durable
+        _fsync_path(path.parent)
+    return size
+
+
+class GroupCommit:
+    """Lets concurrent appenders to one file share a single fsync.
+
+    Each append takes a ticket; the first waiter without a covering fsync
+    becomes the leader and syncs everything written so far for all of them.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._cond = threading.Condition()
+        self._written = 0
+        self._synced = 0
+        self._syncing = False
+        # The file was created since the last sync, so its directory entry must be synced too
+        self._created = False
+
+    def append(self, lines: List[str]) -> int:
+        """Append lines to the file, returning the ticket to pass to `sync`"""
+        with self._cond:
+            with open(self.path, 'a') as f:
+                if f.tell() == 0:
+                    self._created = True
+                f.writelines(lines)
+            self._written += 1
+            return self._written
+
+    def sync(self, ticket: int):
+        """Return once the append with this ticket is on disk"""
+        with self._cond:
+            while self._synced < ticket:
+                if self._syncing:
+                    self._cond.wait()
+                    continue
+                self._syncing = True
+                target = self._written
+                created, self._created = self._created, False
+                self._cond.release()
+                synced = False
+                try:
+                    try:
+                        _fsync_path(self.path)
+                        if created:
+                            _fsync_path(self.path.parent)
+                    except FileNotFoundError:
+                        # Compacted away; the fsynced snapshot already holds these records
+                        pass
+                    synced = True
+                finally:
+                    self._cond.acquire()
+                    self._syncing = False
+                    if synced:
+                        self._synced = max(self._synced, target)
+                    elif created:
+                        self._created = True
+                    self._cond.notify_all()
+
+
+class StorageBackend:
+    """Interface for loading and persisting the medicines, reminders, orders and notifications stores"""
+
+    def load(self, store: str) -> MutableMapping[str, Dict]:
+        """Return the mapping of record id to record for a store.
+
+        Medicines, reminders and orders are returned as records.Medicine,
+        Reminder and Order; they are converted to dicts only when written.
+        """
+        raise NotImplementedError
+
+    def save(self, store: str, data: MutableMapping[str, Dict], keys: Optional[Iterable[str]] = None) -> bool:
+        """Persist a store after its mapping was changed.
+
+        `keys` names the records that changed; None means the whole store.
+        """
+        raise NotImplementedError
+
+    def save_all(self, changes: Dict[str, Tuple[MutableMapping[str, Dict], Iterable[str]]]) -> bool:
+        """Persist several stores changed by one operation, given as store -> (data, keys).
+
+        Each store is written once; backends with transactions commit them together.
+        """
+        saved = True
+        for store, (data, keys) in changes.items():
+            saved = self.save(store, data, keys) and saved
+        return saved
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[None]:
+        """Group the writes and saves of one operation.
+
+        Backends that write records on assignment keep other threads out until
+        the block ends and roll back its uncommitted writes if it raises.
+        """
+        yield
+
+    def reminder_ids(self, reminders: MutableMapping[str, Dict], start: datetime.date,
+                     end: Optional[datetime.date] = None) -> Iterable[str]:
+        """Return candidate reminder ids whose reminder date falls within [start, end].
+
+        Backends without a reminder date index return every id and leave the
+        date check to the caller.
+        """
+        return list(reminders.keys())
+
+    def notification_ids(self, notifications: MutableMapping[str, Dict], status: str) -> List[str]:
+        """Return the ids of notifications with a delivery status"""
+        # Snapshot the items: the scheduler thread queues notifications while delivery workers look for pending ones
+        return [key for key, notification in list(notifications.items()) if notification['status'] == status]
+
+    def external_changes(self) -> Optional[Dict[str, Set[str]]]:
+        """Return the keys of records, by store, that another process changed since the last call.
+
+        None means the changes are unknown and everything must be reloaded.
+        Only backends that can be shared between processes ever report changes.
+        """
+        return {}
+
+    def status(self) -> Dict:
+        """Describe the backend for the status tool"""
+        return {'backend': type(self).__name__}
+
+    def close(self):
+        """Release any resources held by the backend"""
+
+
+class MemoryBackend(StorageBackend):
+    """Starts every store empty and keeps changes in memory only; nothing is written to disk"""
+
+    def load(self, store: str) -> Dict:
+        return {}
+
+    def save(self, store: str, data: MutableMapping[str, Dict], keys: Optional[Iterable[str]] = None) -> bool:
+        return True
+
+
+class YamlBackend(StorageBackend):
+    """Stores each store in a YAML file, optionally with an append-only journal"""
+
+    def __init__(self, data_dir: Path, journal: bool = False, compact_threshold: int = 10000,
+                 snapshot: bool = False, fsync: bool = True):
+        self.data_dir = data_dir
+        self.journal = journal
+        self.compact_threshold = compact_threshold
+        self.fsync = fsync
+        if snapshot and msgpack is None:
+            logger.warning("msgpack is not installed; binary snapshots disabled")
+        # Write a msgpack snapshot next to each YAML file and load it when it is current
+        self.snapshot = snapshot and msgpack is not None
+        # Number of records currently in each store's journal
+        self._journal_entries: Dict[str, int] = {}
+        self._journal_commits = {store: GroupCommit(self._journal_path(store)) for store in STORES}
+        # Serializes journal appends against compaction of the same store
+        self._store_locks = {store: threading.Lock() for store in STORES}
+        # Full saves requested and completed per store; a save requested before
+        # another one started writing is covered by it and skips its own write
+        self._saves_requested = {store: 0 for store in STORES}
+        self._saves_written = {store: 0 for store in STORES}
+        self._saves_lock = threading.Lock()
+        # Stores whose data could not be read; they are never rewritten or compacted
+        self._failed_loads = set()
+
+        # Ensure data directory and files exist
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        for tmp_path in self.data_dir.glob('.*.tmp'):
+            # Left behind by a crash before the rename; the target file is intact
+            tmp_path.unlink()
+        for store in STORES:
+            file_path = self._file_path(store)
+            if not file_path.exists():
+                atomic_write(file_path, lambda f: yaml.dump({}, f, Dumper=YamlDumper), fsync=self.fsync)
+
+    def _file_path(self, store: str) -> Path:
+        return self.data_dir / f"{store}.yaml"
+
+    def _journal_path(self, store: str) -> Path:
+        return self.data_dir / f"{store}.journal"
+
+    def _snapshot_path(self, store: str) -> Path:
+        return self.data_dir / f"{store}.msgpack"
+
+    def load(self, store: str) -> Dict:
+        """Load data from the snapshot or YAML file and replay its journal on top.
+
+        Raises StorageLoadError if the file cannot be read, rather than
+        returning an empty store that the next save would write over it.
+        """
+        data = self._load_snapshot(store) if self.snapshot else None
+        if data is None:
+            file_path = self._file_path(store)
+            try:
+                with open(file_path, 'r') as f:
+                    data = yaml.load(f, Loader=YamlLoader)
+                if data is None:
+                    data = {}
+                elif not isinstance(data, dict):
+                    raise ValueError(f"expected a mapping, found {type(data).__name__}")
+            except Exception as e:
+                self._failed_loads.add(store)
+                logger.error(f"Error loading data from {file_path}: {e}")
+                raise StorageLoadError(f"Cannot load {store} from {file_path}: {e}") from e
+            if self.snapshot:
+                self._save_snapshot(store, data)
+
+        self._journal_entries[store] = self._replay_journal(data, store)
+        self._failed_loads.discard(store)
+        return records_from_dicts(store, data)
+
+    def _load_snapshot(self, store: str) -> Optional[Dict]:
+        """Load a store's binary snapshot, or None if it is missing, stale or unreadable"""
+        snapshot_path = self._snapshot_path(store)
+        try:
+            # A YAML file edited after the snapshot was written takes precedence
+            if snapshot_path.stat().st_mtime_ns < self._file_path(store).stat().st_mtime_ns:
+                return None
+            with open(snapshot_path, 'rb') as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return None
+
+        header = SNAPSHOT_MAGIC + bytes([SNAPSHOT_VERSION])
+        if not raw.startswith(header):
+            logger.warning(f"Ignoring snapshot {snapshot_path} with unknown format")
+            return None
+        try:
+            return msgpack.unpackb(raw[len(header):], raw=False)
+        except Exception as e:
+            logger.error(f"Error loading snapshot {snapshot_path}: {e}")
+            return None
+
+    def _save_snapshot(self, store: str, data: Dict):
+        """Write a store's binary snapshot"""
+        snapshot_path = self._snapshot_path(store)
+        try:
+            # Values msgpack cannot encode, such as dates in a hand-edited YAML file, fail here
+            payload = SNAPSHOT_MAGIC + bytes([SNAPSHOT_VERSION]) + msgpack.packb(data, use_bin_type=True)
+            atomic_write(snapshot_path, lambda f: f.write(payload), binary=True, fsync=self.fsync)
+        except Exception as e:
+            logger.error(f"Error saving snapshot {snapshot_path}: {e}")
+            return
+        METRICS.increment('storage_bytes_written', len(payload), store=store, file='msgpack')
+
+    def _replay_journal(self, data: Dict, store: str) -> int:
+        """Apply journaled mutations to a loaded snapshot, returning the record count.
+
+        A torn final record left by a crash mid-append is cut off the file, so
+        the next append starts on a line of its own.
+        """
+        journal_path = self._journal_path(store)
+        if not journal_path.exists():
+            return 0
+
+        count = 0
+        # Bytes at the start of the journal that hold complete records
+        complete = 0
+        with open(journal_path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError("record is not terminated")
+                    op, key, value = json.loads(line)
+                except ValueError:
+                    if f.read(1):
+                        # Only the last record can be torn; anything else is corruption
+                        self._failed_loads.add(store)
+                        logger.error(f"Corrupt record at byte {complete} of {journal_path}")
+                        raise StorageLoadError(f"Cannot replay {journal_path}: corrupt record at byte {complete}")
+                    logger.warning(f"Discarding incomplete journal record at the end of {journal_path}")
+                    break
+                if op == 'put':
+                    data[key] = value
+                elif op == 'del':
+                    data.pop(key, None)
+                count += 1
+                complete += len(line)
+
+        if complete < journal_path.stat().st_size:
+            os.truncate(journal_path, complete)
+            if self.fsync:
+                _fsync_path(journal_path)
+        return count
+
+    def save(self, store: str, data: Dict, keys: Optional[Iterable[str]] = None) -> bool:
+        if not self.journal or keys is None:
+            return self._save_full(store, data)
+
+        lines = []
+        for key in keys:
+            op = ['put', key, record_to_dict(data[key])] if key in data else ['del', key, None]
+            lines.append(json.dumps(op, separators=(',', ':')) + '\n')
+        with self._store_locks[store]:
+            try:
+                ticket = self._journal_commits[store].append(lines)
+            except Exception as e:
+                logger.error(f"Error appending to journal for {store}: {e}")
+                return False
+
+            # Journal lines are ASCII JSON, so characters are bytes
+            METRICS.increment('storage_bytes_written', sum(map(len, lines)), store=store, file='journal')
+            entries = self._journal_entries.get(store, 0) + len(lines)
+            self._journal_entries[store] = entries
+            if entries >= self.compact_threshold:
+                logger.info(f"Compacting journal for {store} ({entries} records)")
+                return self._save_data(store, data, snapshot=self.snapshot)
+
+        if self.fsync:
+            # Outside the store lock so concurrent appenders share one fsync
+            try:
+                self._journal_commits[store].sync(ticket)
+            except OSError as e:
+                logger.error(f"Error syncing journal for {store}: {e}")
+                return False
+        return True
+
+    def status(self) -> Dict:
+        return {
+            'backend': 'journal' if self.journal else 'yaml',
+            'yaml_implementation': YAML_IMPLEMENTATION,
+            'binary_snapshot': self.snapshot,
+            'fsync': self.fsync,
+            'journal_records': dict(self._journal_entries),
+        }
+
+    def _save_full(self, store: str, data: Dict) -> bool:
+        """Rewrite a store, unless a write that started after this call already covered it"""
+        with self._saves_lock:
+            self._saves_requested[store] += 1
+            ticket = self._saves_requested[store]
+        with self._store_locks[store]:
+            if self._saves_written[store] >= ticket:
+                return True
+            with self._saves_lock:
+                covered = self._saves_requested[store]
+            if not self._save_data(store, data):
+                return False
+            self._saves_written[store] = covered
+            return True
+
+    def _save_data(self, store: str, data: Dict, snapshot: bool = False) -> bool:
+        """Save data to YAML file, and to the binary snapshot if asked; the caller holds the store lock.
+
+        Snapshots are only written at load and at journal compaction, so a
+        save without one drops the snapshot it leaves stale.
+        """
+        file_path = self._file_path(store)
+        if store in self._failed_loads:
+            # Writing would replace the unreadable file, and drop its journal, with partial data
+            logger.error(f"Not saving {store} to {file_path}: it failed to load")
+            return False
+        # Serialize a point-in-time copy; other threads may insert while it is written
+        data = {key: record_to_dict(record) for key, record in dict(data).items()}
+        try:
+            size = atomic_write(file_path, lambda f: yaml.dump(data, f, Dumper=YamlDumper), fsync=self.fsync)
+        except Exception as e:
+            logger.error(f"Error saving data to {file_path}: {e}")
+            return False
+        METRICS.increment('storage_bytes_written', size, store=store, file='yaml')
+        if snapshot:
+            self._save_snapshot(store, data)
+        elif self.snapshot:
+            self._snapshot_path(store).unlink(missing_ok=True)
+
+        # The snapshot now holds every journaled mutation
+        journal_path = self._journal_path(store)
+        if journal_path.exists():
+            journal_path.unlink()
+        self._journal_entries[store] = 0
+        return True
+
+
+class WriteBehindFlusher:
+    """Background thread that persists the dirty stores of every WriteBehindBackend attached to it.
+
+    One flusher serves the backends of all patients, so the number of threads
+    does not grow with them.
+    """
+
+    def __init__(self, max_delay: float):
+        self.max_delay = max_delay
+        # Backends with unwritten changes, in the order they were first changed
+        self._dirty: List['WriteBehindBackend'] = []
+        self._closed = False
+        self._cond = threading.Condition()
+
+        self._thread = threading.Thread(target=self._run, name="write-behind-flusher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def mark_dirty(self, backend: 'WriteBehindBackend'):
+        """Schedule a backend that just went from clean to dirty for the next flush"""
+        with self._cond:
+            was_clean = not self._dirty
+            self._dirty.append(backend)
+            if was_clean:
+                self._cond.notify()
+
+    def _run(self):
+        """Flush dirty backends at most `max_delay` seconds after they were first changed"""
+        while True:
+            with self._cond:
+                while not self._dirty and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                # Let the rest of a burst accumulate; close() cuts the wait short
+                self._cond.wait(self.max_delay)
+                backends, self._dirty = self._dirty, []
+            for backend in backends:
+                backend.flush()
+
+    def close(self):
+        """Stop the thread and write the changes still pending"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        with self._cond:
+            backends, self._dirty = self._dirty, []
+        for backend in backends:
+            backend.flush()
+
+
+class WriteBehindBackend(StorageBackend):
+    """Wraps a backend so saves only mark stores dirty and a background thread persists them.
+
+    Bursts of saves to a store are coalesced into one write per store; every
+    change reaches the wrapped backend within the flusher's `max_delay`
+    seconds. Without a shared `flusher` the backend starts its own.
+    """
+
+    def __init__(self, inner: StorageBackend, max_delay: float, flusher: Optional[WriteBehindFlusher] = None):
+        self.inner = inner
+        self.max_delay = max_delay
+        # store -> (data, changed keys or None for the whole store)
+        self._dirty: Dict[str, Tuple[MutableMapping[str, Dict], Optional[set]]] = {}
+        self._cond = threading.Condition()
+        # Serializes flushes from the flusher thread, close() and explicit flush() calls
+        self._flush_lock = threading.Lock()
+
+        self._owns_flusher = flusher is None
+        self._flusher = flusher if flusher is not None else WriteBehindFlusher(max_delay)
+
+    def load(self, store: str) -> MutableMapping[str, Dict]:
+        return self.inner.load(store)
+
+    def save(self, store: str, data: MutableMapping[str, Dict], keys: Optional[Iterable[str]] = None) -> bool:
+        return self.save_all({store: (data, keys)})
+
+    def save_all(self, changes: Dict[str, Tuple[MutableMapping[str, Dict], Iterable[str]]]) -> bool:
+        with self._cond:
+            was_clean = not self._dirty
+            for store, (data, keys) in changes.items():
+                pending = self._dirty.get(store)
+                if keys is None or (pending is not None and pending[1] is None):
+                    merged = None
+                else:
+                    merged = set(keys) | (pending[1] if pending is not None else set())
+                self._dirty[store] = (data, merged)
+            if was_clean:
+                self._flusher.mark_dirty(self)
+        return True
+
+    def flush(self) -> bool:
+        """Write every dirty store to the wrapped backend now"""
+        with self._flush_lock:
+            with self._cond:
+                dirty, self._dirty = self._dirty, {}
+            if not dirty:
+                return True
+
+            changes = {}
+            for store, (data, keys) in dirty.items():
+                # Dump a shallow copy of in-memory stores so later inserts cannot resize it mid-write
+                changes[store] = (data.copy() if isinstance(data, dict) else data, keys)
+            if self.inner.save_all(changes):
+                return True
+
+            # Keep failed stores dirty so the next flush retries them
+            logger.error(f"Write-behind flush failed for {', '.join(dirty)}; will retry")
+            self.save_all(dirty)
+            return False
+
+    def transaction(self) -> Iterator[None]:
+        return self.inner.transaction()
+
+    def reminder_ids(self, reminders: MutableMapping[str, Dict], start: datetime.date,
+                     end: Optional[datetime.date] = None) -> Iterable[str]:
+        return self.inner.reminder_ids(reminders, start, end)
+
+    def notification_ids(self, notifications: MutableMapping[str, Dict], status: str) -> List[str]:
+        return self.inner.notification_ids(notifications, status)
+
+    def external_changes(self) -> Optional[Dict[str, Set[str]]]:
+        return self.inner.external_changes()
+
+    def status(self) -> Dict:
+        with self._cond:
+            dirty_stores = sorted(self._dirty)
+        return dict(self.inner.status(), write_behind_seconds=self.max_delay, dirty_stores=dirty_stores)
+
+    def close(self):
+        """Write any pending changes and close the wrapped backend, and the flusher if it is this backend's own"""
+        if self._owns_flusher:
+            self._flusher.close()
+        self.flush()
+        self.inner.close()
+
+
+# Reminder date of the medicine referenced by a reminders row, mirroring
+# MedicineReminder: last refill (or added) date + refill period - days before empty
+_REMINDER_DATE_SQL = """
+    SELECT date(
+        coalesce(json_extract(m.data, '$.last_refill_date'), json_extract(m.data, '$.added_date')),
+        printf('%+d days',
+               coalesce(json_extract(m.data, '$.refill_period_days'), 30)
+               - coalesce(json_extract(reminders.data, '$.days_before_empty'), 5))
+    )
+    FROM medicines m WHERE m.patient_id = reminders.patient_id AND m.id = reminders.medicine_id
+"""
+
+# Every table holds the records of all patients, keyed by patient first
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS medicines (
+        patient_id TEXT NOT NULL,
+        id TEXT NOT NULL,
+        data TEXT NOT NULL,
+        PRIMARY KEY (patient_id, id)
+    );
+    CREATE TABLE IF NOT EXISTS reminders (
+        patient_id TEXT NOT NULL,
+        medicine_id TEXT NOT NULL,
+        reminder_date TEXT,
+        data TEXT NOT NULL,
+        PRIMARY KEY (patient_id, medicine_id)
+    );
+    CREATE INDEX IF NOT EXISTS reminders_reminder_date ON reminders (patient_id, reminder_date);
+    CREATE TABLE IF NOT EXISTS orders (
+        patient_id TEXT NOT NULL,
+        id TEXT NOT NULL,
+        medicine_id TEXT NOT NULL,
+        order_date TEXT NOT NULL,
+        data TEXT NOT NULL,
+        PRIMARY KEY (patient_id, id)
+    );
+    CREATE INDEX IF NOT EXISTS orders_medicine_id ON orders (patient_id, medicine_id);
+    CREATE INDEX IF NOT EXISTS orders_order_date ON orders (patient_id, order_date);
+    CREATE TABLE IF NOT EXISTS notifications (
+        patient_id TEXT NOT NULL,
+        id TEXT NOT NULL,
+        status TEXT NOT NULL,
+        data TEXT NOT NULL,
+        PRIMARY KEY (patient_id, id)
+    );
+    CREATE INDEX IF NOT EXISTS notifications_status ON notifications (patient_id, status);
+    CREATE TABLE IF NOT EXISTS changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        writer TEXT NOT NULL,
+        patient_id TEXT NOT NULL,
+        store TEXT NOT NULL,
+        key TEXT NOT NULL
+    );
+"""
+
+# Primary key column of each table, after the patient id
+_KEY_COLUMNS = {'medicines': 'id', 'reminders': 'medicine_id', 'orders': 'id', 'notifications': 'id'}
+
+
+class SQLiteTable(MutableMapping[str, Dict]):
+    """Mapping view over one patient's rows of an SQLite table; records are read and written on access.
+
+    Records are decoded afresh on every read, so changes must be assigned back to be stored.
+    Writes are part of the backend's open transaction until `SQLiteBackend.save`.
+    """
+
+    def __init__(self, backend: 'SQLiteBackend', store: str):
+        self._backend = backend
+        self._store = store
+        self._key = _KEY_COLUMNS[store]
+
+    def _query(self, sql: str, params: Tuple = ()) -> List[Tuple]:
+        database = self._backend.database
+        with database.lock:
+            return database.conn.execute(sql, (self._backend.patient_id,) + params).fetchall()
+
+    def __getitem__(self, key: str) -> Dict:
+        rows = self._query(f"SELECT data FROM {self._store} WHERE patient_id = ? AND {self._key} = ?", (key,))
+        if not rows:
+            raise KeyError(key)
+        return record_from_dict(self._store, json.loads(rows[0][0]))
+
+    def __contains__(self, key: object) -> bool:
+        return bool(self._query(f"SELECT 1 FROM {self._store} WHERE patient_id = ? AND {self._key} = ?", (key,)))
+
+    def __setitem__(self, key: str, record: Dict):
+        self._backend.put(self._store, key, record)
+
+    def __delitem__(self, key: str):
+        if key not in self:
+            raise KeyError(key)
+        self._backend.delete(self._store, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter([row[0] for row in self._query(f"SELECT {self._key} FROM {self._store} WHERE patient_id = ?")])
+
+    def __len__(self) -> int:
+        return self._query(f"SELECT COUNT(*) FROM {self._store} WHERE patient_id = ?")[0][0]
+
+    def items(self) -> List[Tuple[str, Dict]]:
+        rows = self._query(f"SELECT {self._key}, data FROM {self._store} WHERE patient_id = ?")
+        return [(key, record_from_dict(self._store, json.loads(data))) for key, data in rows]
+
+    def values(self) -> List[Dict]:
+        rows = self._query(f"SELECT data FROM {self._store} WHERE patient_id = ?")
+        return [record_from_dict(self._store, json.loads(row[0])) for row in rows]
+
+
+class SQLiteDatabase:
+    """One SQLite database in WAL mode holding the records of every patient.
+
+    The backends of all patients share its connection and lock, so a process
+    keeps one set of file descriptors however many patients it serves. With
+    `change_log` every write also appends (writer, patient, store, key) to the
+    changes table, so processes sharing the database can apply each other's
+    changes record by record instead of reloading everything.
+    """
+
+    def __init__(self, db_path: Path, change_log: bool = False):
+        self.db_path = db_path
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # The connection is shared by the scheduler thread and tool handlers
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(medicines)")]
+        if columns and 'patient_id' not in columns:
+            self.conn.close()
+            raise StorageLoadError(f"{db_path} keeps one patient per database; move it aside to start a new one")
+        self.conn.executescript(_SCHEMA)
+        self.change_log = change_log
+        # Identifies this connection's rows in the change log
+        self._writer = uuid.uuid4().hex
+        self._commits = 0
+        # Changes whenever another connection commits to the database
+        self._data_version = self._read_data_version()
+        # Last change log row this connection has seen
+        self._last_seq = self.conn.execute("SELECT coalesce(MAX(seq), 0) FROM changes").fetchone()[0]
+        # Patients with an open backend, the keys other connections changed that
+        # each has not taken yet, and those that must reload everything instead
+        self._open: Set[str] = set()
+        self._external: Dict[str, Dict[str, Set[str]]] = {}
+        self._reload: Set[str] = set()
+
+    def backend(self, patient_id: str, owns_database: bool = False) -> 'SQLiteBackend':
+        """Return the backend of one patient's records; with `owns_database` closing it closes the database"""
+        with self.lock:
+            self._open.add(patient_id)
+        return SQLiteBackend(self, patient_id, owns_database)
+
+    def release(self, patient_id: str):
+        """Forget a patient whose backend was closed"""
+        with self.lock:
+            self._open.discard(patient_id)
+            self._external.pop(patient_id, None)
+            self._reload.discard(patient_id)
+
+    def patient_ids(self) -> List[str]:
+        """Return the patients that have stored medicines"""
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT DISTINCT patient_id FROM medicines ORDER BY patient_id")]
+
+    def has_patient(self, patient_id: str) -> bool:
+        """Return whether a patient has stored medicines"""
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM medicines WHERE patient_id = ? LIMIT 1", (patient_id,)).fetchone() is not None
+
+    def log_change(self, patient_id: str, store: str, key: str):
+        """Record a write in the change log; the caller holds the lock"""
+        if self.change_log:
+            self.conn.execute(
+                "INSERT INTO changes (writer, patient_id, store, key) VALUES (?, ?, ?, ?)",
+                (self._writer, patient_id, store, key)
+            )
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[None]:
+        """Hold the lock from an operation's first write to its commit, rolling back if it raises"""
+        # The connection is shared, so no other thread can read or commit a half-applied operation
+        with self.lock:
+            try:
+                yield
+            except BaseException:
+                self.rollback()
+                raise
+
+    def commit(self):
+        """Commit the open transaction, trimming the change log now and then"""
+        with self.lock:
+            if self.change_log:
+                self._commits += 1
+                if self._commits % CHANGE_LOG_TRIM_INTERVAL == 0:
+                    # The newest row always stays, so a reader can tell it missed trimmed ones
+                    self.conn.execute(
+                        "DELETE FROM changes WHERE seq < (SELECT MAX(seq) FROM changes) - ?", (CHANGE_LOG_RETAIN,)
+                    )
+            self.conn.commit()
+
+    def rollback(self):
+        """Discard the open transaction's writes"""
+        with self.lock:
+            try:
+                self.conn.rollback()
+            except sqlite3.Error as e:
+                logger.error(f"Error rolling back {self.db_path}: {e}")
+
+    def _read_data_version(self) -> int:
+        with self.lock:
+            return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def external_changes(self, patient_id: str) -> Optional[Dict[str, Set[str]]]:
+        """Return store -> keys that other connections changed for a patient since the last call,
+        or None if the patient must reload everything"""
+        with self.lock:
+            self._read_change_log()
+            if patient_id in self._reload:
+                self._reload.discard(patient_id)
+                self._external.pop(patient_id, None)
+                return None
+            return self._external.pop(patient_id, {})
+
+    def _read_change_log(self):
+        """Sort the change log rows written by other connections by open patient; the caller holds the lock"""
+        version = self._read_data_version()
+        if version == self._data_version:
+            return
+        self._data_version = version
+        if not self.change_log:
+            self._reload.update(self._open)
+            return
+
+        first_seq = self.conn.execute("SELECT MIN(seq) FROM changes").fetchone()[0]
+        rows = self.conn.execute(
+            "SELECT seq, writer, patient_id, store, key FROM changes WHERE seq > ? ORDER BY seq", (self._last_seq,)
+        ).fetchall()
+        # Rows this connection has not seen were trimmed away
+        missed = first_seq is not None and first_seq > self._last_seq + 1
+
+        for seq, writer, patient_id, store, key in rows:
+            if writer != self._writer and patient_id in self._open:
+                self._external.setdefault(patient_id, {}).setdefault(store, set()).add(key)
+            self._last_seq = seq
+        if missed:
+            self._reload.update(self._open)
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+
+class SQLiteBackend(StorageBackend):
+    """Stores one patient's records in a shared SQLiteDatabase with per-record updates"""
+
+    def __init__(self, database: SQLiteDatabase, patient_id: str, owns_database: bool = False):
+        self.database = database
+        self.patient_id = patient_id
+        self._owns_database = owns_database
+
+    def load(self, store: str) -> SQLiteTable:
+        return SQLiteTable(self, store)
+
+    def put(self, store: str, key: str, record: Dict):
+        """Insert or replace a record within the open transaction"""
+        record = record_to_dict(record)
+        data = json.dumps(record, separators=(',', ':'))
+        conn = self.database.conn
+        with self.database.lock:
+            if store == 'medicines':
+                conn.execute(
+                    "INSERT INTO medicines (patient_id, id, data) VALUES (?, ?, ?) "
+                    "ON CONFLICT (patient_id, id) DO UPDATE SET data = excluded.data",
+                    (self.patient_id, key, data)
+                )
+            elif store == 'reminders':
+                conn.execute(
+                    "INSERT INTO reminders (patient_id, medicine_id, data) VALUES (?, ?, ?) "
+                    "ON CONFLICT (patient_id, medicine_id) DO UPDATE SET data = excluded.data",
+                    (self.patient_id, key, data)
+                )
+            elif store == 'notifications':
+                conn.execute(
+                    "INSERT INTO notifications (patient_id, id, status, data) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (patient_id, id) DO UPDATE SET status = excluded.status, data = excluded.data",
+                    (self.patient_id, key, record['status'], data)
+                )
+            else:
+                conn.execute(
+                    "INSERT INTO orders (patient_id, id, medicine_id, order_date, data) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (patient_id, id) DO UPDATE SET medicine_id = excluded.medicine_id, "
+                    "order_date = excluded.order_date, data = excluded.data",
+                    (self.patient_id, key, record['medicine_id'], record['order_date'], data)
+                )
+
+            # Keep the computed reminder date in step with its inputs
+            if store in ('medicines', 'reminders'):
+                conn.execute(
+                    f"UPDATE reminders SET reminder_date = ({_REMINDER_DATE_SQL}) "
+                    "WHERE patient_id = ? AND medicine_id = ?",
+                    (self.patient_id, key)
+                )
+            self.database.log_change(self.patient_id, store, key)
+
+    def delete(self, store: str, key: str):
+        """Delete a record within the open transaction"""
+        with self.database.lock:
+            self.database.conn.execute(
+                f"DELETE FROM {store} WHERE patient_id = ? AND {_KEY_COLUMNS[store]} = ?", (self.patient_id, key)
+            )
+            self.database.log_change(self.patient_id, store, key)
+
+    def transaction(self) -> Iterator[None]:
+        return self.database.transaction()
+
+    def save(self, store: str, data: MutableMapping[str, Dict], keys: Optional[Iterable[str]] = None) -> bool:
+        # Records were written on assignment; saving commits them
+        try:
+            self.database.commit()
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Error committing {store} to {self.database.db_path}: {e}")
+            self.database.rollback()
+            return False
+
+    def save_all(self, changes: Dict[str, Tuple[MutableMapping[str, Dict], Iterable[str]]]) -> bool:
+        # Every pending write belongs to the open transaction; one commit covers all stores
+        try:
+            self.database.commit()
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Error committing {', '.join(changes)} to {self.database.db_path}: {e}")
+            self.database.rollback()
+            return False
+
+    def reminder_ids(self, reminders: MutableMapping[str, Dict], start: datetime.date,
+                     end: Optional[datetime.date] = None) -> List[str]:
+        sql = "SELECT medicine_id FROM reminders WHERE patient_id = ? AND reminder_date >= ?"
+        params: Tuple = (self.patient_id, start.isoformat())
+        if end is not None:
+            sql += " AND reminder_date <= ?"
+            params += (end.isoformat(),)
+        with self.database.lock:
+            return [row[0] for row in self.database.conn.execute(sql + " ORDER BY reminder_date", params)]
+
+    def notification_ids(self, notifications: MutableMapping[str, Dict], status: str) -> List[str]:
+        with self.database.lock:
+            return [row[0] for row in self.database.conn.execute(
+                "SELECT id FROM notifications WHERE patient_id = ? AND status = ?", (self.patient_id, status)
+            )]
+
+    def external_changes(self) -> Optional[Dict[str, Set[str]]]:
+        return self.database.external_changes(self.patient_id)
+
+    def status(self) -> Dict:
+        return {
+            'backend': 'sqlite',
+            'sqlite_version': sqlite3.sqlite_version,
+            'database': str(self.database.db_path),
+        }
+
+    def close(self):
+        self.database.release(self.patient_id)
+        if self._owns_database:
+            self.database.close()
+
+
+def create_storage(mode: str, data_dir: Path, compact_threshold: int = 10000,
+                   snapshot: bool = False, write_behind: float = 0, fsync: bool = True,
+                   shared: bool = False, patient_id: str = 'default', database: Optional[SQLiteDatabase] = None,
+                   flusher: Optional[WriteBehindFlusher] = None) -> StorageBackend:
+    """Create the storage backend of one patient for a storage mode name.
+
+    YAML stores live in `data_dir`. SQLite keeps the patient's rows in
+    `database`, shared by all patients, or in a database of its own in
+    `data_dir`. A positive `write_behind` defers saves to `flusher`, or a
+    flusher of the backend's own, with that many seconds as the durability
+    bound; SQLite commits every operation and does not support it. `shared`
+    keeps a change log so other server processes can follow this one's writes.
+    """
+    if write_behind > 0 and mode == 'sqlite':
+        # Deferred commits would leave acknowledged writes in the open transaction,
+        # where the next rollback discards them
+        raise ValueError("Write-behind is not supported with sqlite storage")
+    if mode == 'yaml':
+        backend = YamlBackend(data_dir, snapshot=snapshot, fsync=fsync)
+    elif mode == 'journal':
+        backend = YamlBackend(data_dir, journal=True, compact_threshold=compact_threshold,
+                              snapshot=snapshot, fsync=fsync)
+    elif mode == 'sqlite':
+        if database is not None:
+            backend = database.backend(patient_id)
+        else:
+            backend = SQLiteDatabase(data_dir / SQLITE_DATABASE, change_log=shared).backend(patient_id, owns_database=True)
+    else:
+        raise ValueError(f"Unknown storage mode: {mode}")
+
+    if write_behind > 0:
+        return WriteBehindBackend(backend, write_behind, flusher)
+    return backend
@@ -1,32 +1,340 @@
 #!/usr/bin/env python
+"""Load-testing client for the Medicine Reminder MCP server.
+
+Spawns main.py over stdio, or connects to a server already running on a
+network transport, and calls the payloads of test_payloads.json through a
+real MCP session. `MEDICINE_ID_PLACEHOLDER` is replaced with the id of a
+medicine returned by an earlier add_medicine call.
+
+    python test_client.py                          # list the payloads
+    python test_client.py add_medicine             # send one payload and print the response
+    python test_client.py --duration 30 --concurrency 16
+    python test_client.py --rate 200 --requests 5000 --mix add_medicine=1,order_refill=4
+    python test_client.py --transport streamable-http --url http://127.0.0.1:8000/mcp --connections 4
+"""
 
-import json
-import sys
 import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import datetime
+import contextlib
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
 
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.sse import sse_client
+from mcp.client.stdio import stdio_client
+from mcp.client.streamable_http import streamablehttp_client
 
-def main():
-    """Simple test client for the Medicine Reminder MCP server."""
-    # Load test payloads
-    with open('test_payloads.json', 'r') as f:
-        test_payloads = json.load(f)
-    
-    # Check if a specific test was requested
-    if len(sys.argv) > 1 and sys.argv[1] in test_payloads:
-        # Run specific test
-        test_name = sys.argv[1]
-        payload = test_payloads[test_name]
-        print(f"Running test: {test_name}")
-        print(json.dumps(payload))
-        # In a real client, you would send this to the MCP server
-        # For now, we just print it to stdout
+SERVER = Path(__file__).resolve().parent / "main.py"
+PLACEHOLDER = "MEDICINE_ID_PLACEHOLDER"
+DEFAULT_MIX = "add_medicine=1,list_medicines=2,set_reminder=1,order_refill=1,get_upcoming_reminders=2"
+DEFAULT_URLS = {
+    'streamable-http': "http://127.0.0.1:8000/mcp",
+    'sse': "http://127.0.0.1:8000/sse",
+}
+
+
+def load_payloads(path: str) -> Dict[str, Dict]:
+    """Load named payloads; a file holding a single payload is named after its tool"""
+    with open(path, 'r') as f:
+        payloads = json.load(f)
+    if 'tool' in payloads:
+        payloads = {payloads['tool']: payloads}
+    return payloads
+
+
+def parse_mix(mix: str, payloads: Dict[str, Dict]) -> Tuple[List[str], List[float]]:
+    """Parse "name=weight,..." into payload names and their weights"""
+    names, weights = [], []
+    for item in mix.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in payloads:
+            raise SystemExit(f"Unknown payload in --mix: {name}")
+        names.append(name)
+        weights.append(float(weight or 1))
+    return names, weights
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Return the nearest-rank percentile of sorted values"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def decode_text(text: str) -> Any:
+    """Decode one text block as JSON, or return it as is if it is not JSON"""
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def result_data(result) -> Any:
+    """Decode the JSON returned by a tool, or None if it returned no text.
+
+    A tool returning a list gets one text block per item, so several blocks
+    are decoded into a list.
+    """
+    values = [decode_text(content.text) for content in result.content if getattr(content, 'text', None) is not None]
+    if not values:
+        return None
+    return values[0] if len(values) == 1 else values
+
+
+def error_message(result) -> str:
+    texts = [content.text for content in result.content if getattr(content, 'text', None)]
+    return texts[0] if texts else "tool error"
+
+
+class LoadTest:
+    """Drives a weighted mix of payloads through MCP sessions and records every call"""
+
+    def __init__(self, sessions: List[ClientSession], payloads: Dict[str, Dict], names: List[str],
+                 weights: List[float], patient_id: str, seed: int):
+        self.sessions = sessions
+        self.payloads = payloads
+        self.names = names
+        self.weights = weights
+        self.patient_id = patient_id
+        self.rng = random.Random(seed)
+        # Ids of medicines returned by add_medicine, used for MEDICINE_ID_PLACEHOLDER
+        self.medicine_ids: List[str] = []
+        # payload name -> latencies in seconds of successful and failed calls
+        self.latencies: Dict[str, List[float]] = {name: [] for name in names}
+        self.errors: Dict[str, Counter] = {name: Counter() for name in names}
+        self._calls = 0
+
+    def arguments(self, name: str) -> Dict:
+        """Build the arguments of a payload, resolving medicine id placeholders"""
+        arguments = dict(self.payloads[name]['params'])
+        for key, value in arguments.items():
+            if value == PLACEHOLDER:
+                if not self.medicine_ids:
+                    raise RuntimeError("No medicine id to replace MEDICINE_ID_PLACEHOLDER with")
+                arguments[key] = self.rng.choice(self.medicine_ids)
+        if self.patient_id:
+            arguments['patient_id'] = self.patient_id
+        return arguments
+
+    async def call(self, name: str, started: Optional[float] = None) -> Any:
+        """Call one payload and record its latency, measured from `started` when it was scheduled earlier"""
+        session = self.sessions[self._calls % len(self.sessions)]
+        self._calls += 1
+        payload = self.payloads[name]
+        if started is None:
+            started = time.perf_counter()
+        data = None
+        try:
+            result = await session.call_tool(payload['tool'], self.arguments(name))
+            if result.isError:
+                self.errors[name][error_message(result)[:200]] += 1
+            else:
+                data = result_data(result)
+                if payload['tool'] == 'add_medicine' and isinstance(data, dict) and 'id' in data:
+                    self.medicine_ids.append(data['id'])
+        except Exception as e:
+            self.errors[name][f"{type(e).__name__}: {e}"[:200]] += 1
+        self.latencies[name].append(time.perf_counter() - started)
+        return data
+
+    async def seed(self, count: int):
+        """Add medicines before the timed run so placeholders can be resolved from the start"""
+        add = next((name for name, payload in self.payloads.items() if payload['tool'] == 'add_medicine'), None)
+        if add is None:
+            return
+        self.latencies.setdefault(add, [])
+        self.errors.setdefault(add, Counter())
+        await asyncio.gather(*(self.call(add) for _ in range(count)))
+        self.latencies[add] = []
+        self.errors[add] = Counter()
+
+    async def run_closed(self, concurrency: int, requests: Optional[int], deadline: float):
+        """Keep `concurrency` calls in flight until the request count or deadline is reached"""
+        issued = 0
+
+        async def worker():
+            nonlocal issued
+            while (requests is None or issued < requests) and time.perf_counter() < deadline:
+                issued += 1
+                await self.call(self.rng.choices(self.names, self.weights)[0])
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    async def run_open(self, rate: float, concurrency: int, requests: Optional[int], deadline: float):
+        """Start calls at a fixed rate, with at most `concurrency` in flight.
+
+        Latency is measured from the time a call was scheduled, so time spent
+        waiting for a free slot while the server falls behind is included.
+        """
+        slots = asyncio.Semaphore(concurrency)
+        tasks = []
+
+        async def scheduled_call(name: str, started: float):
+            try:
+                await self.call(name, started)
+            finally:
+                slots.release()
+
+        start = time.perf_counter()
+        issued = 0
+        while requests is None or issued < requests:
+            scheduled = start + issued / rate
+            if scheduled >= deadline:
+                break
+            await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+            await slots.acquire()
+            tasks.append(asyncio.create_task(scheduled_call(self.rng.choices(self.names, self.weights)[0], scheduled)))
+            issued += 1
+        await asyncio.gather(*tasks)
+
+    def report(self, elapsed: float) -> Dict:
+        """Summarize throughput, latency percentiles and errors per payload and overall"""
+        def summary(latencies: List[float], errors: int) -> Dict:
+            latencies = sorted(latencies)
+            calls = len(latencies)
+            return {
+                'calls': calls,
+                'errors': errors,
+                'error_rate': round(errors / calls, 4) if calls else 0.0,
+                'calls_per_sec': round(calls / elapsed, 3) if elapsed else 0.0,
+                'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+                'p90_ms': round(percentile(latencies, 0.90) * 1000, 3),
+                'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+                'max_ms': round(latencies[-1] * 1000, 3) if latencies else 0.0,
+            }
+
+        tools = {
+            name: dict(summary(self.latencies[name], sum(self.errors[name].values())),
+                       error_messages=dict(self.errors[name].most_common(5)))
+            for name in self.names
+        }
+        every_latency = [latency for name in self.names for latency in self.latencies[name]]
+        every_error = sum(tools[name]['errors'] for name in self.names)
+        return {'seconds': round(elapsed, 3), 'total': summary(every_latency, every_error), 'tools': tools}
+
+
+def print_report(report: Dict):
+    header = f"{'payload':<24} {'calls':>8} {'errors':>7} {'calls/s':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+    print(header)
+    print('-' * len(header))
+    rows = list(report['tools'].items()) + [('total', report['total'])]
+    for name, row in rows:
+        print(f"{name:<24} {row['calls']:>8} {row['errors']:>7} {row['calls_per_sec']:>9.1f} {row['p50_ms']:>9.2f} "
+              f"{row['p90_ms']:>9.2f} {row['p99_ms']:>9.2f} {row['max_ms']:>9.2f}")
+    for name, row in report['tools'].items():
+        for message, count in row['error_messages'].items():
+            print(f"{name}: {count} x {message}")
+
+
+async def open_session(stack: contextlib.AsyncExitStack, args) -> ClientSession:
+    """Open an initialized MCP session on the configured transport"""
+    timeout = datetime.timedelta(seconds=args.timeout)
+    if args.transport == 'stdio':
+        env = dict(os.environ, MEDICINE_REMINDER_TRANSPORT='stdio')
+        params = StdioServerParameters(command=sys.executable, args=[str(SERVER)], env=env, cwd=str(SERVER.parent))
+        server_log = stack.enter_context(open(args.server_log, 'a'))
+        read, write = await stack.enter_async_context(stdio_client(params, errlog=server_log))
+    elif args.transport == 'streamable-http':
+        read, write, _ = await stack.enter_async_context(streamablehttp_client(args.url, timeout=args.timeout))
     else:
-        # List available tests
+        read, write = await stack.enter_async_context(sse_client(args.url, timeout=args.timeout))
+    session = await stack.enter_async_context(ClientSession(read, write, read_timeout_seconds=timeout))
+    await session.initialize()
+    return session
+
+
+async def run(args, payloads: Dict[str, Dict]):
+    async with contextlib.AsyncExitStack() as stack:
+        sessions = [await open_session(stack, args) for _ in range(args.connections)]
+
+        if args.tests:
+            # Send each named payload once and print the response
+            test = LoadTest(sessions, payloads, args.tests, [1.0] * len(args.tests), args.patient_id, args.seed)
+            await test.seed(1 if any(PLACEHOLDER in payloads[name]['params'].values() for name in args.tests) else 0)
+            for name in args.tests:
+                print(f"Running test: {name}")
+                data = await test.call(name)
+                if test.errors[name]:
+                    print(f"Error: {next(iter(test.errors[name]))}")
+                else:
+                    print(json.dumps(data, indent=2))
+            return
+
+        names, weights = parse_mix(args.mix, payloads)
+        test = LoadTest(sessions, payloads, names, weights, args.patient_id, args.seed)
+        await test.seed(args.seed_medicines)
+
+        print(f"Running {args.transport} load test: {args.mix} "
+              + (f"at {args.rate:g} calls/s, " if args.rate else "")
+              + f"concurrency {args.concurrency}, connections {args.connections}", file=sys.stderr)
+        started = time.perf_counter()
+        deadline = started + args.duration if args.duration else float('inf')
+        if args.rate:
+            await test.run_open(args.rate, args.concurrency, args.requests, deadline)
+        else:
+            await test.run_closed(args.concurrency, args.requests, deadline)
+        report = test.report(time.perf_counter() - started)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(dict(report, config=vars(args)), f, indent=2)
+
+
+def main():
+    """Load-testing client for the Medicine Reminder MCP server."""
+    parser = argparse.ArgumentParser(description="Call the Medicine Reminder MCP server and measure it under load")
+    parser.add_argument('tests', nargs='*', help="payloads to send once each instead of running a load test")
+    parser.add_argument('--payloads', default=str(SERVER.parent / 'test_payloads.json'))
+    parser.add_argument('--transport', default='stdio', choices=['stdio', 'streamable-http', 'sse'])
+    parser.add_argument('--url', help="server URL for the network transports")
+    parser.add_argument('--connections', type=int, default=1,
+                        help="MCP sessions to spread calls over (network transports only)")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="weighted payloads, e.g. add_medicine=1,order_refill=4")
+    parser.add_argument('--concurrency', type=int, default=8, help="calls in flight at once")
+    parser.add_argument('--rate', type=float, help="start calls at this many per second instead of back to back")
+    parser.add_argument('--duration', type=float, help="seconds to run for (default 10 unless --requests is given)")
+    parser.add_argument('--requests', type=int, help="total calls to make")
+    parser.add_argument('--seed-medicines', type=int, default=20,
+                        help="medicines to add before the run to resolve MEDICINE_ID_PLACEHOLDER")
+    parser.add_argument('--patient-id', default='loadtest',
+                        help="patient the calls act on, keeping load test data apart (empty for the server default)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--timeout', type=float, default=30, help="seconds to wait for each response")
+    parser.add_argument('--server-log', default=os.devnull, help="file receiving the stdio server's log")
+    parser.add_argument('--output', help="also write the report as JSON to this file")
+    parser.add_argument('--list', action='store_true', help="list the available payloads")
+    args = parser.parse_args()
+
+    payloads = load_payloads(args.payloads)
+    if args.list or (len(sys.argv) == 1):
         print("Available tests:")
-        for test_name in test_payloads.keys():
+        for test_name in payloads.keys():
             print(f"  - {test_name}")
-        print("\nUsage: python test_client.py [test_name]")
+        print("\nUsage: python test_client.py [test_name ...] | [--duration N] [--concurrency N] [--rate N]")
+        return
+
+    unknown = [name for name in args.tests if name not in payloads]
+    if unknown:
+        raise SystemExit(f"Unknown payload: {', '.join(unknown)}")
+    if args.transport == 'stdio' and args.connections != 1:
+        raise SystemExit("--connections applies to the network transports; stdio serves a single session")
+    if args.transport != 'stdio' and not args.url:
+        args.url = DEFAULT_URLS[args.transport]
+    if args.duration is None and args.requests is None:
+        args.duration = 10
+
+    asyncio.run(run(args, payloads))
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,6 @@
+import os
+import tempfile
+
+# main builds a registry on import; keep it and the tests away from the real data directory
+os.environ.setdefault("MEDICINE_REMINDER_DATA_DIR", tempfile.mkdtemp(prefix="medicine-reminder-tests-"))
+os.environ.pop("MEDICINE_REMINDER_WEBHOOK_URL", None)
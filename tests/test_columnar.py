@@ -0,0 +1,49 @@
+import datetime
+
+import pytest
+
+pytest.importorskip('numpy')
+
+import main
+from columnar import DueDateColumns
+from records import Medicine, Reminder
+
+
+def make_records(last_refill_dates):
+    medicines, reminders = {}, {}
+    for index, last_refill_date in enumerate(last_refill_dates):
+        key = f"med_{index:08x}"
+        medicines[key] = Medicine(id=key, patient_id='default', name='Lisinopril', dosage='10mg', quantity=30,
+                                  refill_period_days=30, added_date='2026-01-01', last_refill_date=last_refill_date)
+        reminders[key] = Reminder(medicine_id=key, patient_id='default', days_before_empty=5, reminder_time='08:00')
+    return medicines, reminders
+
+
+def test_select_computes_reminder_and_empty_dates():
+    medicines, reminders = make_records(['2026-01-01', '2026-03-01', 'March 2, 2026', 'not a date'])
+
+    selected = DueDateColumns.build(medicines, reminders).select(datetime.date(2026, 2, 1))
+
+    assert sorted(selected) == [
+        ('med_00000001', datetime.date(2026, 3, 26), datetime.date(2026, 3, 31)),
+        ('med_00000002', datetime.date(2026, 3, 27), datetime.date(2026, 4, 1)),
+    ]
+
+
+def test_columnar_startup_indexes_the_same_reminders(tmp_path, monkeypatch):
+    shard = main.MedicineReminder(main.create_storage('yaml', tmp_path, fsync=False), schedule=main.ReminderSchedule())
+    # The first reminder was due two days ago, so neither path indexes it
+    for refill_period_days in (3, 30, 60):
+        medicine = shard.add_medicine('Lisinopril', '10mg', 30, refill_period_days)
+        shard.set_reminder(medicine.id, 5, '08:00')
+    expected = shard.get_upcoming_reminders()
+    shard.close()
+    assert len(expected) == 2
+
+    monkeypatch.setattr(main, 'COLUMNAR_ENGINE', True)
+    shard = main.MedicineReminder(main.create_storage('yaml', tmp_path, fsync=False), schedule=main.ReminderSchedule())
+    try:
+        assert shard.get_status()['columnar_engine']
+        assert shard.get_upcoming_reminders() == expected
+    finally:
+        shard.close()
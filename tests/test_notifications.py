@@ -0,0 +1,278 @@
+import json
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+import pytest
+
+import main
+import notifications
+from notifications import DELIVERED, FAILED, TokenBucket, WhatsAppClient, retry_delay
+
+
+class StubWebhook:
+    """HTTP endpoint that records every request and answers with the queued statuses, then `default_status`"""
+
+    def __init__(self):
+        self.statuses: List[int] = []
+        self.default_status = 200
+        # One entry per request: client port, headers, JSON body and arrival time
+        self.requests: List[Dict] = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep connections alive, as a real provider would
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                stub.requests.append({
+                    'port': self.client_address[1],
+                    'headers': dict(self.headers),
+                    'body': body,
+                    'time': time.monotonic(),
+                })
+                self.send_response(stub.statuses.pop(0) if stub.statuses else stub.default_status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/messages"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def webhook():
+    stub = StubWebhook()
+    yield stub
+    stub.close()
+
+
+def make_notification(index: int = 0) -> Dict:
+    return {
+        'id': f"ntf_med_{index:08x}_20260101",
+        'patient_id': 'patient_1',
+        'medicine_id': f"med_{index:08x}",
+        'message': "Reminder: Your Lisinopril (10mg) will run out soon.",
+    }
+
+
+def test_send_posts_idempotency_key(webhook):
+    client = WhatsAppClient(webhook.url)
+    try:
+        assert client.send(make_notification()) is None
+    finally:
+        client.close()
+
+    [request] = webhook.requests
+    assert request['headers']['Idempotency-Key'] == 'patient_1:ntf_med_00000000_20260101'
+    assert request['body'] == {
+        'patient_id': 'patient_1',
+        'medicine_id': 'med_00000000',
+        'message': "Reminder: Your Lisinopril (10mg) will run out soon.",
+    }
+
+
+def test_send_reports_error_status(webhook):
+    webhook.default_status = 503
+    client = WhatsAppClient(webhook.url)
+    try:
+        error = client.send(make_notification())
+    finally:
+        client.close()
+
+    assert error is not None and '503' in error
+    assert client.metrics.snapshot()['failed'] == 1
+
+
+def test_send_batch_reuses_pooled_connection(webhook):
+    client = WhatsAppClient(webhook.url)
+    try:
+        errors = client.send_batch([make_notification(i) for i in range(10)])
+    finally:
+        client.close()
+
+    assert errors == [None] * 10
+    assert len(webhook.requests) == 10
+    assert len({request['port'] for request in webhook.requests}) == 1
+
+
+def test_token_bucket_paces_sends(webhook):
+    # 20 messages per second with no burst: 6 sends span at least 5 intervals of 50ms
+    client = WhatsAppClient(webhook.url, rate=20, burst=1)
+    try:
+        assert client.send_batch([make_notification(i) for i in range(6)]) == [None] * 6
+    finally:
+        client.close()
+
+    times = [request['time'] for request in webhook.requests]
+    assert times[-1] - times[0] >= 5 / 20 * 0.9
+    assert client.metrics.snapshot()['throttled_seconds'] > 0
+
+
+def test_token_bucket_allows_burst():
+    bucket = TokenBucket(rate=1, burst=5)
+    started = time.monotonic()
+    waited = [bucket.acquire() for _ in range(5)]
+    assert waited == [0.0] * 5
+    assert time.monotonic() - started < 0.5
+
+
+def test_token_bucket_burst_below_one_still_sends():
+    bucket = TokenBucket(rate=20, burst=0.5)
+    started = time.monotonic()
+    for _ in range(3):
+        bucket.acquire()
+    assert time.monotonic() - started < 1
+
+
+def test_retry_delay_backs_off_exponentially(monkeypatch):
+    # Full jitter draws from [0, cap]; take the cap to see the backoff itself
+    monkeypatch.setattr(notifications.random, 'uniform', lambda low, high: high)
+    assert [retry_delay(attempts, 2, 300) for attempts in range(1, 11)] == [2, 4, 8, 16, 32, 64, 128, 256, 300, 300]
+
+
+def queue_due_notification(patients: main.PatientRegistry) -> str:
+    """Add a medicine whose reminder is due now and let the scheduler queue its notification"""
+    shard = patients.shard(main.DEFAULT_PATIENT_ID)
+    medicine = shard.add_medicine('Lisinopril', '10mg', 30, 30)
+    # Runs out in 30 days and is reminded 30 days before: due today at midnight
+    shard.set_reminder(medicine.id, 30, '00:00')
+    patients._check_reminders()
+    [key] = shard.notifications
+    return key
+
+
+def deliver_until_finished(patients: main.PatientRegistry, client, key: str) -> Dict:
+    """Run a dispatcher until the notification is no longer pending and return its record"""
+    shard = patients.shard(main.DEFAULT_PATIENT_ID)
+    dispatcher = main.NotificationDispatcher(patients, client, workers=1)
+
+    async def deliver():
+        task = asyncio.create_task(dispatcher.run())
+        try:
+            while shard.notifications[key]['status'] == main.PENDING:
+                await asyncio.sleep(0.01)
+        finally:
+            task.cancel()
+
+    try:
+        asyncio.run(asyncio.wait_for(deliver(), timeout=10))
+    finally:
+        dispatcher.close()
+    return shard.notifications[key]
+
+
+@pytest.fixture
+def patients(tmp_path, monkeypatch):
+    # Retry quickly so a test sees every attempt
+    monkeypatch.setattr(main, 'DELIVERY_MAX_ATTEMPTS', 3)
+    monkeypatch.setattr(main, 'DELIVERY_RETRY_BASE', 0.05)
+    registry = main.PatientRegistry(tmp_path, 'yaml', fsync=False)
+    yield registry
+    registry.close()
+
+
+def test_failed_delivery_is_retried_then_delivered(webhook, patients):
+    webhook.statuses = [500]
+    key = queue_due_notification(patients)
+
+    notification = deliver_until_finished(patients, WhatsAppClient(webhook.url), key)
+
+    assert notification['status'] == DELIVERED
+    assert notification['attempts'] == 2
+    assert len(webhook.requests) == 2
+    # A retry carries the same idempotency key, so the provider can drop duplicates
+    assert len({request['headers']['Idempotency-Key'] for request in webhook.requests}) == 1
+
+
+def test_delivery_marked_failed_after_max_attempts(webhook, patients):
+    webhook.default_status = 500
+    key = queue_due_notification(patients)
+
+    notification = deliver_until_finished(patients, WhatsAppClient(webhook.url), key)
+
+    assert notification['status'] == FAILED
+    assert notification['attempts'] == 3
+    assert '500' in notification['last_error']
+    assert 'failed_at' in notification
+    assert len(webhook.requests) == 3
+
+    # The outcome is stored, not just held in memory
+    reloaded = main.PatientRegistry(patients.data_dir, 'yaml', fsync=False)
+    try:
+        assert reloaded.shard(main.DEFAULT_PATIENT_ID).notifications[key]['status'] == FAILED
+    finally:
+        reloaded.close()
+
+
+def fail_once(monkeypatch, target, name: str):
+    """Make `target.name` raise on its first call only"""
+    original = getattr(target, name)
+    calls = []
+
+    def wrapper(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise OSError("storage unavailable")
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(target, name, wrapper)
+    return calls
+
+
+def test_failed_reminder_scan_is_retried(patients, monkeypatch):
+    shard = patients.shard(main.DEFAULT_PATIENT_ID)
+    calls = fail_once(monkeypatch, shard, '_queue_due_reminders')
+
+    with pytest.raises(RuntimeError):
+        queue_due_notification(patients)
+    assert not shard.notifications
+
+    # The due reminder went back on the schedule for the next scan
+    patients._check_reminders()
+    assert len(calls) == 2
+    assert len(shard.notifications) == 1
+
+
+def test_dispatcher_survives_storage_error(webhook, patients, monkeypatch):
+    monkeypatch.setattr(main, 'SCHEDULER_RETRY_DELAY', 0.05)
+    key = queue_due_notification(patients)
+    calls = fail_once(monkeypatch, patients, 'record_deliveries')
+
+    notification = deliver_until_finished(patients, WhatsAppClient(webhook.url), key)
+
+    assert notification['status'] == DELIVERED
+    assert len(calls) == 2
+
+
+def test_scheduler_running_reports_dead_tasks(patients):
+    reminder = main.AsyncMedicineReminder(patients)
+
+    async def check():
+        reminder.start_scheduler()
+        await asyncio.sleep(0.05)
+        assert reminder.scheduler_running
+        reminder._scheduler_tasks[1].cancel()
+        await asyncio.sleep(0.05)
+        assert not reminder.scheduler_running
+        await reminder.stop_scheduler()
+
+    try:
+        asyncio.run(check())
+    finally:
+        reminder._executor.shutdown(wait=True)
+        reminder.dispatcher.close()
@@ -0,0 +1,78 @@
+import asyncio
+import dataclasses
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def reminder(tmp_path):
+    registry = main.PatientRegistry(tmp_path, 'yaml', fsync=False)
+    reminder = main.AsyncMedicineReminder(registry)
+    yield reminder
+    reminder.close()
+
+
+@pytest.mark.parametrize('method_name, args', [
+    ('list_medicines', (None, None, '', 'not a date', None)),
+    ('list_medicines', (0, None, '', None, None)),
+    ('list_medicines', (None, 'not a cursor', '', None, None)),
+    ('get_upcoming_reminders', (0,)),
+    ('set_reminder', ('med_00000000', 5, '08:00')),
+    ('order_refills', (['med_00000000'],)),
+])
+def test_unknown_patient_validates_like_a_known_one(reminder, method_name, args):
+    reminder.patients.shard('known', create=True)
+
+    def call(patient_id):
+        with pytest.raises(ValueError) as error:
+            asyncio.run(getattr(reminder, method_name)(patient_id, *args))
+        return str(error.value)
+
+    assert call('unknown') == call('known')
+    # Nothing was stored for the unknown patient
+    assert reminder.patients.shard('unknown', create=False) is None
+
+
+def test_unknown_patient_has_no_medicines(reminder):
+    assert asyncio.run(reminder.list_medicines('unknown')) == {'medicines': [], 'next_cursor': None}
+    assert asyncio.run(reminder.get_upcoming_reminders('unknown')) == []
+    assert reminder.patients.shard('unknown', create=False) is None
+
+
+def list_all(shard, **filters):
+    """Page through list_medicines and return the ids in order"""
+    ids, cursor = [], None
+    while True:
+        page = shard.list_medicines(limit=3, cursor=cursor, **filters)
+        ids.extend(medicine.id for medicine in page['medicines'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            return ids
+
+
+@pytest.mark.parametrize('filters', [
+    {'added_from': '2026-01-10', 'added_to': '2026-01-12'},
+    {'added_from': '2026-01-05'},
+    {'added_to': '2026-01-03', 'name_prefix': 'b'},
+    {'added_from': '2026-01-01', 'name_prefix': 'Aspirin 1'},
+])
+def test_added_date_filters_page_in_name_order(tmp_path, filters):
+    shard = main.MedicineReminder(main.create_storage('yaml', tmp_path, fsync=False), schedule=main.ReminderSchedule())
+    try:
+        for day in range(1, 21):
+            for name in ('Aspirin', 'Benazepril'):
+                medicine = shard.add_medicine(f"{name} {day}", '10mg', 30, 30)
+                shard.medicines[medicine.id] = dataclasses.replace(medicine, added_date=f"2026-01-{day:02d}")
+                shard._refresh_indexes(medicine.id)
+
+        expected = [
+            medicine.id for medicine in sorted(shard.medicines.values(), key=lambda m: (m.name.casefold(), m.id))
+            if medicine.name.casefold().startswith(filters.get('name_prefix', '').casefold())
+            and filters.get('added_from', '0') <= medicine.added_date <= filters.get('added_to', '9')
+        ]
+        assert expected
+        assert list_all(shard, **filters) == expected
+    finally:
+        shard.close()
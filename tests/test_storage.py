@@ -0,0 +1,186 @@
+import os
+import stat
+import threading
+import time
+
+import pytest
+
+import storage
+from records import Order
+from storage import NEW_FILE_MODE, SQLiteDatabase, StorageLoadError, YamlBackend, create_storage
+
+
+def make_order(key: str) -> Order:
+    return Order(id=key, patient_id='default', medicine_id='med_00000000', medicine_name='Lisinopril',
+                 medicine_dosage='10mg', order_date='2026-01-01', status='placed')
+
+
+def journal_backend(data_dir) -> YamlBackend:
+    return YamlBackend(data_dir, journal=True, fsync=False)
+
+
+def test_journal_replays_appended_records(tmp_path):
+    backend = journal_backend(tmp_path)
+    orders = backend.load('orders')
+    for key in ('a', 'b'):
+        orders[key] = make_order(key)
+        assert backend.save('orders', orders, [key])
+    del orders['a']
+    assert backend.save('orders', orders, ['a'])
+
+    assert list(journal_backend(tmp_path).load('orders')) == ['b']
+
+
+def test_journal_drops_torn_last_record_and_keeps_later_appends(tmp_path):
+    backend = journal_backend(tmp_path)
+    orders = backend.load('orders')
+    for key in ('a', 'b'):
+        orders[key] = make_order(key)
+        assert backend.save('orders', orders, [key])
+    # A crash in the middle of appending a third record
+    with open(tmp_path / 'orders.journal', 'a') as f:
+        f.write('["put","x",{"id":"x","med')
+
+    restarted = journal_backend(tmp_path)
+    orders = restarted.load('orders')
+    assert sorted(orders) == ['a', 'b']
+    orders['c'] = make_order('c')
+    assert restarted.save('orders', orders, ['c'])
+
+    assert sorted(journal_backend(tmp_path).load('orders')) == ['a', 'b', 'c']
+
+
+def test_journal_with_corrupt_record_before_the_end_fails_to_load(tmp_path):
+    backend = journal_backend(tmp_path)
+    orders = backend.load('orders')
+    orders['a'] = make_order('a')
+    assert backend.save('orders', orders, ['a'])
+    journal_path = tmp_path / 'orders.journal'
+    journal_path.write_text('not json\n' + journal_path.read_text())
+
+    restarted = journal_backend(tmp_path)
+    with pytest.raises(StorageLoadError):
+        restarted.load('orders')
+    # The journal is kept for repair rather than compacted away
+    assert not restarted.save('orders', {}, None)
+    assert journal_path.read_text().startswith('not json\n')
+
+
+def test_concurrent_full_saves_share_one_write(tmp_path, monkeypatch):
+    backend = YamlBackend(tmp_path, fsync=False)
+    orders = backend.load('orders')
+    writes = []
+    atomic_write = storage.atomic_write
+
+    def slow_write(path, *args, **kwargs):
+        writes.append(path)
+        time.sleep(0.05)
+        return atomic_write(path, *args, **kwargs)
+
+    monkeypatch.setattr(storage, 'atomic_write', slow_write)
+
+    def add(key):
+        orders[key] = make_order(key)
+        assert backend.save('orders', orders, [key])
+
+    threads = [threading.Thread(target=add, args=(f"o{i}",)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # The first save writes alone; the ones queued behind it share the next write
+    assert len(writes) < 8
+    assert sorted(YamlBackend(tmp_path, fsync=False).load('orders')) == sorted(f"o{i}" for i in range(8))
+
+
+def test_saves_keep_file_permissions(tmp_path):
+    backend = YamlBackend(tmp_path, fsync=False)
+    assert stat.S_IMODE(os.stat(tmp_path / 'orders.yaml').st_mode) == NEW_FILE_MODE
+    os.chmod(tmp_path / 'orders.yaml', 0o640)
+
+    orders = backend.load('orders')
+    orders['a'] = make_order('a')
+    assert backend.save('orders', orders, ['a'])
+
+    assert stat.S_IMODE(os.stat(tmp_path / 'orders.yaml').st_mode) == 0o640
+
+
+def test_sqlite_rollback_keeps_earlier_commits(tmp_path):
+    backend = create_storage('sqlite', tmp_path)
+    orders = backend.load('orders')
+    with backend.transaction():
+        orders['a'] = make_order('a')
+        assert backend.save('orders', orders, ['a'])
+    with pytest.raises(RuntimeError):
+        with backend.transaction():
+            orders['b'] = make_order('b')
+            raise RuntimeError("operation failed before saving")
+
+    assert sorted(orders) == ['a']
+    backend.close()
+
+
+def test_sqlite_rejects_write_behind(tmp_path):
+    with pytest.raises(ValueError):
+        create_storage('sqlite', tmp_path, write_behind=1)
+
+
+def test_sqlite_database_keeps_patients_apart(tmp_path):
+    database = SQLiteDatabase(tmp_path / 'medicine_reminder.db', change_log=True)
+    alice, bob = database.backend('alice'), database.backend('bob')
+    other = SQLiteDatabase(tmp_path / 'medicine_reminder.db', change_log=True)
+    other_alice, other_bob = other.backend('alice'), other.backend('bob')
+
+    alice_orders = alice.load('orders')
+    with alice.transaction():
+        alice_orders['a'] = make_order('a')
+        assert alice.save('orders', alice_orders, ['a'])
+
+    assert 'a' in alice_orders
+    assert 'a' not in bob.load('orders')
+    # Another connection learns which of its patients' records changed
+    assert other_alice.external_changes() == {'orders': {'a'}}
+    assert other_bob.external_changes() == {}
+    other.close()
+    database.close()
+
+
+def test_snapshot_of_unencodable_yaml_does_not_fail_load(tmp_path):
+    pytest.importorskip('msgpack')
+    YamlBackend(tmp_path, fsync=False)
+    # Unquoted dates in a hand-edited file load as date objects, which msgpack cannot encode
+    (tmp_path / 'notifications.yaml').write_text("n1: {id: n1, status: pending, created_at: 2026-01-01}\n")
+
+    notifications = YamlBackend(tmp_path, snapshot=True, fsync=False).load('notifications')
+
+    assert list(notifications) == ['n1']
+    assert not (tmp_path / 'notifications.msgpack').exists()
+
+
+def test_snapshot_is_written_at_load_and_compaction_only(tmp_path):
+    pytest.importorskip('msgpack')
+    backend = YamlBackend(tmp_path, journal=True, compact_threshold=2, snapshot=True, fsync=False)
+    orders = backend.load('orders')
+    snapshot_path = tmp_path / 'orders.msgpack'
+    loaded_at = snapshot_path.stat().st_mtime_ns
+
+    orders['a'] = make_order('a')
+    assert backend.save('orders', orders, ['a'])
+    assert snapshot_path.stat().st_mtime_ns == loaded_at
+    orders['b'] = make_order('b')
+    assert backend.save('orders', orders, ['b'])
+    assert not (tmp_path / 'orders.journal').exists()
+
+    # The compacted snapshot is loaded in place of the YAML
+    (tmp_path / 'orders.yaml').write_text('{}\n')
+    os.utime(tmp_path / 'orders.yaml', ns=(0, 0))
+    assert sorted(YamlBackend(tmp_path, snapshot=True, fsync=False).load('orders')) == ['a', 'b']
+
+    # A save without a snapshot drops the stale one
+    plain = YamlBackend(tmp_path, snapshot=True, fsync=False)
+    orders = plain.load('orders')
+    del orders['a']
+    assert plain.save('orders', orders, ['a'])
+    assert not snapshot_path.exists()
+    assert list(YamlBackend(tmp_path, snapshot=True, fsync=False).load('orders')) == ['b']